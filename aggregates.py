@@ -0,0 +1,127 @@
+import calendar
+import logging
+
+import pandas as pd
+
+
+CUBE_KEYS = ['empresa', 'year', 'month']
+CUBE_DIMENSIONS = ['tipo_habitacion', 'canal', 'paquete', 'pais', 'agencia', 'segmento', 'estatus_reservacion']
+
+logger = logging.getLogger(__name__)
+
+
+def add_calendar_index(data):
+    """Sorts by fecha_reservacion, indexes on it and adds integer year/month columns.
+
+    Runs once at load so period filters can slice the index instead of masking every row.
+    Rows without a fecha_reservacion belong to no period and are dropped.
+    """
+    missing = data['fecha_reservacion'].isna()
+    if missing.any():
+        logger.warning('Dropping %d rows without fecha_reservacion', int(missing.sum()))
+        data = data[~missing]
+    data = data.sort_values('fecha_reservacion', kind='stable', ignore_index=True)
+    data['year'] = data['fecha_reservacion'].dt.year.astype('int16')
+    data['month'] = data['fecha_reservacion'].dt.month.astype('int8')
+    data.index = pd.DatetimeIndex(data['fecha_reservacion'])
+    data.index.name = None
+    return data
+
+
+def period_slice(data, year=None, month=None):
+    """Rows of a calendar-indexed frame within the year/month, as a positional view."""
+    if year is None:
+        return data
+    if month is None:
+        start, end = pd.Timestamp(year, 1, 1), pd.Timestamp(year + 1, 1, 1)
+    else:
+        start = pd.Timestamp(year, month, 1)
+        end = start + pd.offsets.MonthBegin(1)
+    lo, hi = data.index.searchsorted([start, end], side='left')
+    return data.iloc[lo:hi]
+
+
+def month_label(month):
+    return month if month == 'Todos' else calendar.month_name[month]
+
+
+def available_years(cube, empresa):
+    return sorted(slice_cube(cube, empresa)['year'].unique().tolist())
+
+
+def available_months(cube, empresa, year=None):
+    return sorted(slice_cube(cube, empresa, year)['month'].unique().tolist())
+
+
+def build_revenue_cube(data):
+    """Sums and counts of tfa_total/reservacion per empresa, year, month and each dimension.
+
+    `tfa_reservada` only counts rows with reservacion == 1, which is what the revenue charts show.
+    """
+    reserved = data['reservacion'] == 1
+    frame = pd.DataFrame({
+        'empresa': data['empresa'],
+        'year': data['year'],
+        'month': data['month'],
+        'tfa_total': data['tfa_total'],
+        'tfa_reservada': data['tfa_total'].where(reserved, 0),
+        'reservacion': reserved.astype('int64'),
+        'cancelacion': (data['reservacion'] == 0).astype('int64'),
+    })
+    for dimension in CUBE_DIMENSIONS:
+        frame[dimension] = data[dimension]
+
+    measures = dict(
+        tfa_total=('tfa_total', 'sum'),
+        tfa_reservada=('tfa_reservada', 'sum'),
+        reservacion=('reservacion', 'sum'),
+        cancelacion=('cancelacion', 'sum'),
+        registros=('tfa_total', 'size'),
+    )
+    cube = {None: frame.groupby(CUBE_KEYS, as_index=False, observed=True).agg(**measures)}
+    for dimension in CUBE_DIMENSIONS:
+        cube[dimension] = frame.groupby(CUBE_KEYS + [dimension], as_index=False, observed=True).agg(**measures)
+    return cube
+
+
+def slice_cube(cube, empresa, year=None, month=None, dimension=None):
+    table = cube[dimension]
+    mask = table['empresa'] == empresa
+    if year is not None:
+        mask &= table['year'] == year
+    if month is not None:
+        mask &= table['month'] == month
+    return table[mask]
+
+
+def revenue_totals(cube, empresa, year=None, month=None):
+    totals = slice_cube(cube, empresa, year, month)[['tfa_total', 'reservacion', 'cancelacion']].sum()
+    return int(totals['cancelacion']), int(totals['reservacion']), totals['tfa_total']
+
+
+def monthly_revenue(cube, empresa, year=None, month=None):
+    rows = slice_cube(cube, empresa, year, month)
+    rows = rows[rows['reservacion'] > 0]
+    aggregated = rows.groupby(['year', 'month'], as_index=False)['tfa_reservada'].sum()
+    return pd.DataFrame({
+        'Date': aggregated['year'].astype(str) + '-' + aggregated['month'].map('{:02d}'.format),
+        'Total_TFA': aggregated['tfa_reservada'],
+    })
+
+
+def revenue_by(cube, dimension, empresa, year=None, month=None):
+    rows = slice_cube(cube, empresa, year, month, dimension)
+    rows = rows[rows['reservacion'] > 0]
+    revenue = rows.groupby(dimension, as_index=False, observed=True)['tfa_reservada'].sum()
+    # Plain labels so plotly does not expand unobserved categories.
+    revenue[dimension] = revenue[dimension].astype(object)
+    return revenue.rename(columns={'tfa_reservada': 'tfa_total'})
+
+
+def reservations_by_status(cube, empresa, year=None, month=None):
+    rows = slice_cube(cube, empresa, year, month, 'estatus_reservacion')
+    counts = rows.groupby('estatus_reservacion', observed=True)['reservacion'].sum()
+    counts = counts[counts > 0].sort_values(ascending=False).reset_index()
+    counts.columns = ['estatus_reservacion', 'num_reservations']
+    counts['estatus_reservacion'] = counts['estatus_reservacion'].astype(object)
+    return counts
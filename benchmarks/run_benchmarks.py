@@ -0,0 +1,188 @@
+"""Scaling benchmarks for home.app and model.app on synthetic data.
+
+    python benchmarks/run_benchmarks.py --scales 1e4 1e5 1e6
+    python benchmarks/run_benchmarks.py --scales 1e4 1e5 --update-baselines
+
+Each scale writes a synthetic tcadata bucket, points the data layer at it and runs each page
+headlessly through Streamlit's AppTest, cold and then warm. It reports wall time and peak memory
+(Python heap via tracemalloc, Arrow's allocator and process RSS) of every run, plus the wall time
+of each stage the page's PageProfiler recorded. Results are compared with benchmarks/baselines.json and the script
+exits with status 1 on any regression or on any measurement without a baseline.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import threading
+import tracemalloc
+
+import pyarrow as pa
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import data_access
+import synthetic_data
+
+BASELINES_PATH = os.path.join(ROOT, 'benchmarks', 'baselines.json')
+BUCKET_NAME = 'tcadata'
+SAMPLE_INTERVAL_SECONDS = 0.01
+METRICS = ('seconds', 'peak_mb', 'arrow_peak_mb', 'rss_peak_mb')
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class PeakSampler(threading.Thread):
+    """Samples Arrow's allocated bytes and the process RSS, which tracemalloc does not see."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.stopped = threading.Event()
+        self.arrow_start = pa.total_allocated_bytes()
+        self.rss_start = _rss_bytes()
+        self.arrow_peak = self.arrow_start
+        self.rss_peak = self.rss_start
+
+    def sample(self):
+        self.arrow_peak = max(self.arrow_peak, pa.total_allocated_bytes())
+        self.rss_peak = max(self.rss_peak, _rss_bytes())
+
+    def run(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL_SECONDS):
+            self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+
+def measure(results, name, fn):
+    sampler = PeakSampler()
+    sampler.start()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        value = fn()
+    finally:
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        sampler.stop()
+    results[name] = {
+        'seconds': seconds,
+        'peak_mb': peak / 2**20,
+        'arrow_peak_mb': (sampler.arrow_peak - sampler.arrow_start) / 2**20,
+        'rss_peak_mb': (sampler.rss_peak - sampler.rss_start) / 2**20,
+    }
+    return value
+
+
+def app_runs(results, directory):
+    """Headless runs of each page, first cold (empty cache and a new snapshot directory, so
+    downloads, unpacking and evaluate_model are measured) and then warm. Stage timings come from
+    the page's own PageProfiler records of the run.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    for page in ('home', 'model'):
+        def run(state):
+            app_test = AppTest.from_string(f'import {page}\n{page}.app()\n', default_timeout=600)
+            measure(results, f'{page}.app_{state}', app_test.run)
+            if app_test.exception:
+                raise RuntimeError(f'{page}.app raised: {app_test.exception[0].value}')
+            stages = {}
+            for record in app_test.session_state['profiler_records']:
+                stages[record['stage']] = stages.get(record['stage'], 0.0) + record['seconds']
+            for stage, seconds in stages.items():
+                results[f'{page}.{state}.{stage}'] = {'seconds': seconds}
+
+        data_access.clear_cache()
+        data_access.SNAPSHOT_DIR = tempfile.mkdtemp(prefix=f'snapshots-{page}-', dir=directory)
+        run('cold')
+        run('warm')
+
+
+def run_scale(rows, workdir):
+    directory = os.path.join(workdir, str(rows))
+    synthetic_data.write_bucket(directory, rows, BUCKET_NAME)
+    data_access.DATA_DIR = directory
+
+    results = {}
+    app_runs(results, directory)
+    return results
+
+
+def compare(baselines, measured, tolerance):
+    """Regressions over the baselines. A measured stage or metric without a baseline is a failure
+    too, so a missing or outdated baselines.json cannot make the run pass. Page stages only
+    measure seconds.
+    """
+    regressions = []
+    for key, result in measured.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            regressions.append(f'{key}: no baseline (run with --update-baselines to record one)')
+            continue
+        for metric in METRICS:
+            if metric not in result:
+                continue
+            if metric not in baseline:
+                regressions.append(f'{key} {metric}: no baseline (run with --update-baselines to record one)')
+            elif result[metric] > baseline[metric] * tolerance:
+                regressions.append(f'{key} {metric}: {result[metric]:.3f} > {baseline[metric]:.3f} x {tolerance}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', type=float, default=[1e4, 1e5])
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='Allowed ratio over the stored baseline before a stage counts as a regression.')
+    parser.add_argument('--update-baselines', action='store_true')
+    parser.add_argument('--workdir', help='Where synthetic buckets are written (default: a temporary directory).')
+    args = parser.parse_args(argv)
+    data_access.enable_copy_on_write()
+
+    measured = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        for scale in args.scales:
+            rows = int(scale)
+            for stage, result in run_scale(rows, workdir).items():
+                measured[f'{rows}:{stage}'] = result
+                line = f'{rows:>10} {stage:<40} {result["seconds"]:>9.3f}s'
+                if 'peak_mb' in result:
+                    line += (f' {result["peak_mb"]:>10.1f} MB py {result["arrow_peak_mb"]:>10.1f} MB arrow '
+                             f'{result["rss_peak_mb"]:>10.1f} MB rss')
+                print(line)
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as file:
+            baselines = json.load(file)
+
+    if args.update_baselines:
+        baselines.update(measured)
+        with open(BASELINES_PATH, 'w') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f'Baselines written to {BASELINES_PATH}')
+        return 0
+
+    regressions = compare(baselines, measured, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Synthetic datasets with the schemas of the tcadata bucket, for benchmarking at any scale."""
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingClassifier
+
+
+HOTELS = ['HOTEL 1', 'HOTEL 2', 'HOTEL 3']
+CATEGORIES = {
+    'tipo_habitacion': [f'HABITACION {i}' for i in range(12)],
+    'canal': ['DIRECTO', 'AGENCIA', 'OTA', 'CORPORATIVO', 'TELEFONO'],
+    'paquete': [f'PAQUETE {i}' for i in range(20)],
+    'pais': [f'PAIS {i}' for i in range(60)],
+    'agencia': [f'AGENCIA {i}' for i in range(300)],
+    'segmento': ['LEISURE', 'GRUPOS', 'CORPORATIVO', 'BODAS', 'TRIPULACION'],
+    'estatus_reservacion': ['CONFIRMADA', 'CHECK OUT', 'NO SHOW', 'CANCELADA', 'EN CASA'],
+}
+MODEL_FEATURES = ['avg_days_between_visits', 'dias_estancia', 'total_rooms_reserved', 'total_reservations',
+                  'total_expense', 'avg_tfa', 'cancel_ratio']
+START = pd.Timestamp('2019-01-01')
+END = pd.Timestamp('2020-12-31')
+MAX_TRAINING_ROWS = 20_000
+
+
+def _dates(rng, n):
+    days = (END - START).days
+    return START + pd.to_timedelta(rng.integers(0, days, n), unit='D')
+
+
+def reservations(n, seed=0):
+    rng = np.random.default_rng(seed)
+    num_noches = rng.geometric(0.3, n).astype('int64')
+    data = {
+        'empresa': rng.choice(HOTELS, n, p=[0.6, 0.25, 0.15]),
+        'fecha_reservacion': _dates(rng, n),
+        'reservacion': (rng.random(n) < 0.8).astype('int64'),
+        'tfa_total': np.round(num_noches * rng.gamma(4, 600, n), 2),
+        'num_noches': num_noches,
+    }
+    for column, values in CATEGORIES.items():
+        weights = rng.dirichlet(np.ones(len(values)))
+        data[column] = rng.choice(values, n, p=weights)
+    return pd.DataFrame(data)
+
+
+def dashboard_features(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'id_cliente': rng.permutation(n).astype('float64'),
+        'empresa': rng.choice(HOTELS, n, p=[0.6, 0.25, 0.15]),
+        'fecha_reservacion': _dates(rng, n),
+        'total_reservations': rng.geometric(0.5, n).astype('int64'),
+        'total_nights': rng.geometric(0.2, n).astype('int64'),
+        'total_expense': np.round(rng.gamma(2, 5_000, n), 2),
+    })
+
+
+def model_features(n, seed=2):
+    rng = np.random.default_rng(seed)
+    last_reservation = _dates(rng, n)
+    time_since_last_res = (END - last_reservation).days.to_numpy()
+    data = pd.DataFrame({
+        'client_key': np.arange(n, dtype='int64'),
+        'avg_days_between_visits': rng.gamma(2, 90, n),
+        'dias_estancia': rng.geometric(0.3, n).astype('int64'),
+        'total_rooms_reserved': rng.geometric(0.6, n).astype('int64'),
+        'total_reservations': rng.geometric(0.5, n).astype('int64'),
+        'total_expense': rng.gamma(2, 5_000, n),
+        'avg_tfa': rng.gamma(4, 600, n),
+        'cancel_ratio': rng.random(n),
+        'last_visit': last_reservation + pd.to_timedelta(rng.integers(0, 10, n), unit='D'),
+        'last_reservation': last_reservation,
+        'time_since_last_res': time_since_last_res,
+        'total_people_stayed': rng.integers(1, 6, n),
+    })
+    data['churn'] = time_since_last_res + rng.normal(0, 60, n) > 365
+    return data
+
+
+def model_data(features, seed=3):
+    """A fitted GradientBoostingClassifier plus test split, shaped like model_data.pkl."""
+    rng = np.random.default_rng(seed)
+    X = features[MODEL_FEATURES]
+    y = features['churn'].astype('int64')
+    test = rng.random(len(features)) < 0.2
+    train = np.flatnonzero(~test)[:MAX_TRAINING_ROWS]
+    model = GradientBoostingClassifier(n_estimators=50, random_state=seed)
+    model.fit(X.iloc[train], y.iloc[train])
+    X_test = X[test].reset_index(drop=True)
+    y_test = y[test].reset_index(drop=True)
+    return {'model': model, 'X_test': X_test, 'y_test': y_test, 'y_pred': model.predict(X_test)}
+
+
+def write_bucket(root, rows, bucket_name='tcadata', seed=0):
+    """Writes every dataset for `rows` reservations under root/bucket_name, as TCA_DATA_DIR expects."""
+    directory = os.path.join(root, bucket_name)
+    os.makedirs(directory, exist_ok=True)
+    clients = max(rows // 4, 100)
+    reservations(rows, seed).to_parquet(os.path.join(directory, 'reservaciones_dashboard.parquet'),
+                                        row_group_size=1_000_000)
+    dashboard_features(clients, seed + 1).to_parquet(os.path.join(directory, 'features_dashboard.parquet'))
+    features = model_features(clients, seed + 2)
+    features.to_parquet(os.path.join(directory, 'features_model.parquet'))
+    with open(os.path.join(directory, 'model_data.pkl'), 'wb') as file:
+        pickle.dump(model_data(features, seed + 3), file)
+    return directory
@@ -0,0 +1,178 @@
+import copy
+import math
+
+import numpy as np
+import pandas as pd
+
+
+CURVE_POINT_BUDGET = 500
+SCATTER_EXACT_THRESHOLD = 5_000
+DENSITY_BINS = 60
+HISTOGRAM_BINS = 30
+MAX_OUTLIER_SAMPLES = 200
+
+
+def downsample_curve(x, y, budget=CURVE_POINT_BUDGET):
+    """Largest-Triangle-Three-Buckets decimation of a curve to at most `budget` points.
+
+    The first and last points are always kept and each bucket keeps the point that spans the
+    largest triangle with its neighbours, so the curve shape and the area under it are preserved.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+    if budget is None or budget < 3 or n <= budget:
+        return x, y
+
+    edges = np.linspace(1, n - 1, budget - 1).astype(int)
+    keep = np.empty(budget, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    selected = 0
+    for i in range(budget - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[selected] - next_x) * (y[start:end] - y[selected])
+                      - (x[selected] - x[start:end]) * (next_y - y[selected]))
+        selected = start + int(area.argmax())
+        keep[i + 1] = selected
+    return x[keep], y[keep]
+
+
+def density_grid(x, y, bins=DENSITY_BINS):
+    """2D histogram of the points: bin centres on each axis and a (y, x) count grid.
+
+    Empty cells are NaN so the heatmap leaves them transparent.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    valid = np.isfinite(x) & np.isfinite(y)
+    counts, x_edges, y_edges = np.histogram2d(x[valid], y[valid], bins=bins)
+    counts = counts.T
+    counts[counts == 0] = np.nan
+    return (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2, counts
+
+
+def histogram_edges(values, bins=HISTOGRAM_BINS):
+    values = np.asarray(values, dtype='float64')
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return np.linspace(0, 1, bins + 1)
+    return np.histogram_bin_edges(values, bins=bins)
+
+
+def histogram_summary(values, edges):
+    """Counts and densities of `values` over fixed bin edges."""
+    values = np.asarray(values, dtype='float64')
+    values = values[np.isfinite(values)]
+    counts, _ = np.histogram(values, bins=edges)
+    widths = np.diff(edges)
+    density = counts / (counts.sum() * widths) if counts.sum() else np.zeros(len(counts))
+    return {'centers': (edges[:-1] + edges[1:]) / 2, 'widths': widths, 'counts': counts, 'density': density}
+
+
+def box_summary(values, max_outliers=MAX_OUTLIER_SAMPLES):
+    """Quartiles, Tukey whiskers, mean and a bounded sample of outliers for a precomputed box trace."""
+    values = np.asarray(values, dtype='float64')
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return None
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    outliers = values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)]
+    if len(outliers) > max_outliers:
+        # Keep the extremes so the axis range matches the full data.
+        sample = np.random.default_rng(0).choice(outliers, max_outliers - 2, replace=False)
+        outliers = np.concatenate([[outliers.min(), outliers.max()], sample])
+    return {
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'lowerfence': inside.min(),
+        'upperfence': inside.max(),
+        'mean': values.mean(),
+        'outliers': outliers,
+    }
+
+
+def vega_bin_extent(values, maxbins=10, base=10, divide=(5, 2)):
+    """Start, stop and step of vega-lite's default `bin` (nice=True) for the values."""
+    values = np.asarray(values, dtype='float64')
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return 0.0, 1.0, 1.0
+    start, stop = values.min(), values.max()
+    span = (stop - start) or abs(start) or 1
+    logb = math.log(base)
+    level = math.ceil(math.log(maxbins) / logb)
+    step = base ** (round(math.log(span) / logb) - level)
+    while math.ceil(span / step) > maxbins:
+        step *= base
+    for div in divide:
+        if span / (step / div) <= maxbins:
+            step /= div
+    precision = 0 if step >= 1 else int(-math.log(step) / logb) + 1
+    eps = base ** (-precision - 1)
+    nice_start = math.floor(start / step + eps) * step
+    start = nice_start - step if start < nice_start else nice_start
+    stop = math.ceil(stop / step) * step
+    if stop <= start:
+        stop = start + step
+    return start, stop, step
+
+
+def vega_aggregate(data, spec):
+    """Runs a vega-lite spec's `bin` and `aggregate` encodings in pandas.
+
+    Returns the aggregated frame and a spec that plots it as-is, so only the aggregated rows
+    are sent to the browser. Other encoded fields are kept as group keys; with no aggregate
+    the frame is just projected to the encoded fields.
+    """
+    spec = copy.deepcopy(spec)
+    encoding = spec['encoding']
+    columns, keys, measures, extra = {}, [], {}, {}
+    for channel, enc in encoding.items():
+        field = enc.get('field')
+        if 'aggregate' in enc:
+            op = enc.pop('aggregate')
+            name = f'{op}_{field}' if field else op
+            measures[name] = (field, op)
+            enc['field'] = name
+            enc.setdefault('type', 'quantitative')
+        elif enc.get('bin'):
+            params = enc['bin'] if isinstance(enc['bin'], dict) else {}
+            values = data[field].to_numpy(dtype='float64')
+            start, stop, step = vega_bin_extent(values, params.get('maxbins', 10))
+            bins = max(int(round((stop - start) / step)), 1)
+            index = np.clip(np.floor((values - start) / step), 0, bins - 1)
+            columns[f'{field}_start'] = start + index * step
+            columns[f'{field}_end'] = start + (index + 1) * step
+            keys += [f'{field}_start', f'{field}_end']
+            enc['field'] = f'{field}_start'
+            enc['bin'] = {'binned': True, 'step': step}
+            enc.setdefault('type', 'quantitative')
+            extra[f'{channel}2'] = {'field': f'{field}_end'}
+        elif field:
+            columns[field] = data[field].to_numpy()
+            keys.append(field)
+    encoding.update(extra)
+
+    for field, op in measures.values():
+        if field is not None:
+            columns[field] = data[field].to_numpy()
+    frame = pd.DataFrame(columns)
+    if not measures:
+        return frame, spec
+    if keys:
+        grouped = frame.groupby(keys, observed=True, sort=True)
+    else:
+        grouped = frame.groupby(np.zeros(len(frame), dtype=int))
+    aggregated = pd.DataFrame({
+        name: grouped.size() if op == 'count' else grouped[field].agg(op)
+        for name, (field, op) in measures.items()
+    })
+    return aggregated.reset_index(drop=not keys), spec
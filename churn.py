@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+
+CHURN_WINDOWS = {
+    '1 año': 365,
+    '6 meses': 180,
+    '3 meses': 90,
+    '1 mes': 30
+}
+
+
+class ChurnEngine:
+    """Churn rate for any reference date and window from sorted last-reservation timestamps.
+
+    A client churned when (reference_date - last_reservation).days > window_days, that is, when
+    the last reservation falls at or before reference_date - (window_days + 1) days, so every
+    rate is a single searchsorted over the sorted timestamps.
+    """
+
+    def __init__(self, last_reservations):
+        values = np.asarray(last_reservations, dtype='datetime64[ns]')
+        if values.size and not (values[1:] >= values[:-1]).all():
+            values = np.sort(values)
+        self.last_reservations = values
+
+    def __len__(self):
+        return len(self.last_reservations)
+
+    def _cutoffs(self, reference_dates, window_days):
+        reference_dates = pd.to_datetime(reference_dates)
+        return np.asarray(reference_dates - pd.Timedelta(days=window_days + 1), dtype='datetime64[ns]')
+
+    def rate(self, reference_date, window_days):
+        if not len(self):
+            return float('nan')
+        churned = np.searchsorted(self.last_reservations, self._cutoffs([reference_date], window_days), side='right')
+        return churned[0] / len(self) * 100
+
+    def curve(self, reference_dates, window_days):
+        if not len(self):
+            return np.full(len(reference_dates), np.nan)
+        churned = np.searchsorted(self.last_reservations, self._cutoffs(reference_dates, window_days), side='right')
+        return churned / len(self) * 100
+
+
+def churn_curves(engine, start, end, windows=CHURN_WINDOWS):
+    """Long-format frame of the daily churn rate between start and end for every window."""
+    reference_dates = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D')
+    return pd.concat([
+        pd.DataFrame({'Fecha': reference_dates, 'Periodo': label, 'Churn': engine.curve(reference_dates, days)})
+        for label, days in windows.items()
+    ], ignore_index=True)
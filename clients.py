@@ -0,0 +1,67 @@
+import numpy as np
+
+
+CLIENT_MEASURES = ['total_reservations', 'total_nights', 'total_expense']
+# Grouping keys of each totals table, by the finest filter it answers.
+TOTALS_LEVELS = {
+    'month': ['empresa', 'year', 'month'],
+    'year': ['empresa', 'year'],
+    None: ['empresa'],
+}
+
+
+class ClientIndex:
+    """Per-client totals and record positions for the features_dashboard frame.
+
+    Totals are kept per (empresa, year, month), per (empresa, year) and per empresa, so any
+    filter is a mask over precomputed rows, and each client's records are one contiguous slice
+    of a client-sorted row order, found through a dict keyed by id_cliente.
+    """
+
+    def __init__(self, churn_data):
+        frame = churn_data[['id_cliente', 'empresa', 'year', 'month', 'fecha_reservacion'] + CLIENT_MEASURES]
+        frame = frame[frame['id_cliente'].notna()].reset_index(drop=True)
+        frame['id_cliente'] = frame['id_cliente'].astype('int64')
+        aggregations = dict({measure: 'sum' for measure in CLIENT_MEASURES}, fecha_reservacion='max')
+        self.totals = {
+            level: frame.groupby(keys + ['id_cliente'], as_index=False, observed=True).agg(aggregations)
+            for level, keys in TOTALS_LEVELS.items()
+        }
+
+        rows = np.flatnonzero(churn_data['id_cliente'].notna().to_numpy())
+        ids = churn_data['id_cliente'].to_numpy()[rows].astype('int64')
+        order = np.argsort(ids, kind='stable')
+        self._rows = rows[order]
+        sorted_ids = ids[order]
+        starts = np.flatnonzero(np.diff(sorted_ids, prepend=sorted_ids[:1] - 1))
+        ends = np.r_[starts[1:], len(sorted_ids)]
+        self._slices = dict(zip(sorted_ids[starts].tolist(), zip(starts.tolist(), ends.tolist())))
+
+    def __contains__(self, client_id):
+        return client_id in self._slices
+
+    def top(self, empresa, year=None, month=None, k=10, measure='total_expense'):
+        """The k clients with the largest measure in the period, largest first."""
+        level = 'month' if month is not None else 'year' if year is not None else None
+        table = self.totals[level]
+        mask = table['empresa'] == empresa
+        if year is not None:
+            mask &= table['year'] == year
+        if month is not None:
+            mask &= table['month'] == month
+        rows = table[mask]
+        values = rows[measure].to_numpy()
+        if len(values) > k:
+            # Partial selection of the k largest, then a sort of just those k.
+            candidates = np.argpartition(values, len(values) - k)[len(values) - k:]
+        else:
+            candidates = np.arange(len(values))
+        candidates = candidates[np.argsort(values[candidates], kind='stable')[::-1]]
+        return rows.iloc[candidates]
+
+    def history(self, churn_data, client_id):
+        """The client's rows of `churn_data` (the frame the index was built from), in date order."""
+        bounds = self._slices.get(client_id)
+        if bounds is None:
+            return churn_data.iloc[:0]
+        return churn_data.iloc[self._rows[bounds[0]:bounds[1]]]
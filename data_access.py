@@ -0,0 +1,610 @@
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import weakref
+from urllib.parse import unquote
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from schemas import DATASET_SCHEMAS, optimize_dtypes
+
+
+# How often the background refresher checks cached objects for a new version.
+REFRESH_INTERVAL_SECONDS = int(os.environ.get('TCA_REFRESH_SECONDS', 300))
+PREFETCH_WORKERS = 6
+
+# Set TCA_DATA_DIR to a directory with one sub-folder per bucket to run without S3.
+DATA_DIR = os.environ.get('TCA_DATA_DIR')
+SNAPSHOT_DIR = os.environ.get('TCA_SNAPSHOT_DIR', '/tmp/tca_snapshots')
+
+logger = logging.getLogger(__name__)
+
+
+
+def _read_only(*args, **kwargs):
+    raise TypeError('Cached frames are shared by every session and read-only; derive a new frame '
+                    '(e.g. data.assign(...) or data[columns]) instead of writing to this one.')
+
+
+class _ReadOnlyIndexer:
+    """loc/iloc/at/iat of a ReadOnlyFrame: reads pass through, writes raise."""
+
+    def __init__(self, indexer):
+        self._indexer = indexer
+
+    def __getitem__(self, key):
+        return self._indexer[key]
+
+    __setitem__ = _read_only
+
+    def __call__(self, *args, **kwargs):
+        return _ReadOnlyIndexer(self._indexer(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._indexer, name)
+
+
+class ReadOnlyFrame(pd.DataFrame):
+    """The handle returned for cached frames, shared by every session in the process.
+
+    Column, cell, index and in-place writes raise; every operation that derives a new frame
+    (selection, filtering, assign, groupby, ...) returns a plain, writable DataFrame. With
+    copy-on-write (enabled by the entrypoints), derived frames share the cached buffers until
+    written.
+    """
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    insert = _read_only
+    pop = _read_only
+    update = _read_only
+    # Every inplace=True method (drop, sort_values, rename, fillna, ...) and augmented
+    # assignment (+=, ...) ends in _update_inplace.
+    _update_inplace = _read_only
+
+    def __setattr__(self, name, value):
+        # set_index/reset_index(inplace=True) and rename_axis(inplace=True) assign these too.
+        if name in ('index', 'columns'):
+            _read_only()
+        super().__setattr__(name, value)
+
+    @property
+    def loc(self):
+        return _ReadOnlyIndexer(super().loc)
+
+    @property
+    def iloc(self):
+        return _ReadOnlyIndexer(super().iloc)
+
+    @property
+    def at(self):
+        return _ReadOnlyIndexer(super().at)
+
+    @property
+    def iat(self):
+        return _ReadOnlyIndexer(super().iat)
+
+
+def enable_copy_on_write():
+    """Called once by each entrypoint (main.py, scoring.py, the benchmarks) before loading data."""
+    pd.set_option('mode.copy_on_write', True)
+
+
+class MissingObject(FileNotFoundError):
+    """The object does not exist in the bucket."""
+
+
+class S3Backend:
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+        self.client = boto3.client('s3')
+
+    def version(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise MissingObject(f's3://{self.bucket_name}/{key}') from e
+            raise
+        return head['ETag'].strip('"')
+
+    def download(self, key, path):
+        self.client.download_file(self.bucket_name, key, path)
+
+    def upload(self, path, key):
+        self.client.upload_file(path, self.bucket_name, key)
+
+    def list_keys(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key']
+
+
+class LocalBackend:
+    def __init__(self, root):
+        self.root = root
+
+    def version(self, key):
+        path = os.path.join(self.root, key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError as e:
+            raise MissingObject(path) from e
+        return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+    def download(self, key, path):
+        shutil.copyfile(os.path.join(self.root, key), path)
+
+    def upload(self, path, key):
+        target = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f'{target}.{os.getpid()}.tmp'
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+
+    def list_keys(self, prefix):
+        directory = os.path.join(self.root, prefix)
+        for current, _, files in os.walk(directory):
+            for file_name in files:
+                yield os.path.relpath(os.path.join(current, file_name), self.root).replace(os.sep, '/')
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(bucket_name):
+    # One backend per bucket: boto3 clients are thread-safe once built, but building them is not.
+    backend_key = (DATA_DIR, bucket_name)
+    with _backends_lock:
+        if backend_key not in _backends:
+            if DATA_DIR:
+                _backends[backend_key] = LocalBackend(os.path.join(DATA_DIR, bucket_name))
+            else:
+                _backends[backend_key] = S3Backend(bucket_name)
+        return _backends[backend_key]
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+_flight = SingleFlight()
+_cache_lock = threading.Lock()
+_cache = {}
+_derived = {}
+# Memory before/after dtype optimization, per (bucket_name, file_name, columns).
+memory_reports = {}
+_recording = threading.local()
+_refresher = None
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='tca-prefetch')
+
+
+def snapshot_path(bucket_name, key, version):
+    digest = hashlib.sha256(f'{bucket_name}/{key}@{version}'.encode()).hexdigest()
+    return os.path.join(SNAPSHOT_DIR, f'{digest}{os.path.splitext(key)[1]}')
+
+
+def fetch_object(bucket_name, key, version=None):
+    """Returns a local snapshot path for `version` of the object, by default its current one."""
+    backend = get_backend(bucket_name)
+    if version is None:
+        version = backend.version(key)
+    path = snapshot_path(bucket_name, key, version)
+    if not os.path.exists(path):
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            backend.download(key, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return path
+
+
+def read_parquet(path, columns=None):
+    """Decodes only `columns` of a memory-mapped parquet file into a DataFrame."""
+    table = pq.ParquetFile(path, memory_map=True).read(columns=columns, use_pandas_metadata=True)
+    # self_destruct releases each Arrow column as soon as it has been converted.
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _callable_key(fn):
+    return None if fn is None else f'{fn.__module__}.{fn.__qualname__}'
+
+
+def _record(sources):
+    """Adds object versions to the sources of every cache entry currently loading on this thread."""
+    for frame in getattr(_recording, 'stack', ()):
+        frame.update(sources)
+
+
+def _fetch(bucket_name, key):
+    try:
+        version = get_backend(bucket_name).version(key)
+    except MissingObject:
+        # Recorded as absent (version None), so an entry cached as missing reloads once it exists.
+        _record({('object', bucket_name, key): None})
+        raise
+    _record({('object', bucket_name, key): version})
+    return _flight.do(('object', bucket_name, key, version), lambda: fetch_object(bucket_name, key, version))
+
+
+def _list_keys(bucket_name, prefix):
+    keys = tuple(sorted(get_backend(bucket_name).list_keys(prefix)))
+    _record({('listing', bucket_name, prefix): keys})
+    return keys
+
+
+def _current_version(source):
+    kind, bucket_name, name = source
+    if kind == 'listing':
+        return tuple(sorted(get_backend(bucket_name).list_keys(name)))
+    try:
+        return get_backend(bucket_name).version(name)
+    except MissingObject:
+        return None
+
+
+def _missing_as_none(load, missing_ok):
+    if not missing_ok:
+        return load
+
+    def load_or_none():
+        try:
+            return load()
+        except MissingObject:
+            return None
+
+    return load_or_none
+
+
+class _Entry:
+    """A cached value plus the versions of the objects (and listings) it was loaded from."""
+
+    def __init__(self, value, load, sources):
+        self.value = value
+        self.load = load
+        self.sources = sources
+
+
+def _load_entry(load):
+    stack = _recording.__dict__.setdefault('stack', [])
+    sources = {}
+    stack.append(sources)
+    try:
+        value = load()
+    finally:
+        stack.pop()
+    return _Entry(value, load, sources)
+
+
+def _store(cache_key, entry):
+    with _cache_lock:
+        _cache[cache_key] = entry
+    return entry
+
+
+def _cached(cache_key, load):
+    """Process-wide cached `load()`.
+
+    Entries never expire on read: the background refresher reloads an entry only when one of
+    the objects it was loaded from has a new version, and swaps it in once loaded, so callers
+    keep getting the previous value meanwhile and never wait on a refresh.
+    """
+    _start_refresher()
+    with _cache_lock:
+        entry = _cache.get(cache_key)
+    if entry is None:
+        entry = _flight.do(cache_key, lambda: _store(cache_key, _load_entry(load)))
+    # Nested cached loads, e.g. a partition listing, are sources of the entry loading them.
+    _record(entry.sources)
+    return entry.value
+
+
+def _stale(entry):
+    for source, version in entry.sources.items():
+        try:
+            if _current_version(source) != version:
+                return True
+        except Exception:
+            logger.exception('Could not check %s for a new version', source)
+    return False
+
+
+def _reload(cache_key, entry):
+    new_entry = _load_entry(entry.load)
+    # Values derived from the previous version are rebuilt here, before the swap, so the first
+    # page render after it finds them ready instead of rebuilding them in the foreground.
+    for name, builder in _derived_builders(entry.value):
+        get_derived(new_entry.value, name, builder)
+    return _store(cache_key, new_entry)
+
+
+def refresh_stale():
+    """Reloads the cache entries whose sources changed; returns how many were swapped in.
+
+    Entries are checked in insertion order, so listings refresh before the loads that use them.
+    """
+    with _cache_lock:
+        entries = list(_cache.items())
+    refreshed = 0
+    replaced = set()
+    for cache_key, entry in entries:
+        if not _stale(entry):
+            continue
+        try:
+            _flight.do(cache_key, lambda: _reload(cache_key, entry))
+        except Exception:
+            logger.exception('Refreshing %s failed; keeping the previous version', cache_key)
+            continue
+        logger.info('Refreshed %s', cache_key)
+        replaced.update(entry.sources.items())
+        refreshed += 1
+    _remove_snapshots(replaced)
+    return refreshed
+
+
+def _remove_snapshots(sources):
+    """Deletes the snapshots of object versions no cache entry was loaded from anymore.
+
+    Files derived from a snapshot (e.g. an unpacked model) share its name stem and go with it.
+    Memory-mapped files stay readable for whoever still maps them until they are unmapped.
+    """
+    with _cache_lock:
+        in_use = {item for entry in _cache.values() for item in entry.sources.items()}
+    for (kind, bucket_name, key), version in sources:
+        if kind != 'object' or version is None or ((kind, bucket_name, key), version) in in_use:
+            continue
+        stem = os.path.splitext(snapshot_path(bucket_name, key, version))[0]
+        for path in glob.glob(f'{glob.escape(stem)}*'):
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        logger.info('Removed snapshot of %s/%s@%s', bucket_name, key, version)
+
+
+def _refresh_forever():
+    while True:
+        time.sleep(REFRESH_INTERVAL_SECONDS)
+        try:
+            refresh_stale()
+        except Exception:
+            logger.exception('Background refresh failed')
+
+
+def _start_refresher():
+    global _refresher
+    if _refresher is not None:
+        return
+    with _cache_lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_refresh_forever, name='tca-refresher', daemon=True)
+            _refresher.start()
+
+
+def get_dataset(bucket_name, file_name, columns=None, prepare=None, missing_ok=False):
+    """Process-wide cached parquet dataset, shared without copying by every session.
+
+    The returned frame is a ReadOnlyFrame: assigning into it raises, derive new frames instead.
+
+    `prepare(data)`, if given, runs once per load and its result is what gets cached. With
+    `missing_ok`, a missing object is cached as None (and picked up by the refresher once it
+    exists) instead of raising MissingObject on every call.
+    """
+    if columns is not None:
+        columns = tuple(columns)
+
+    def load():
+        data = read_parquet(_fetch(bucket_name, file_name), columns=list(columns) if columns is not None else None)
+        data, report = optimize_dtypes(data, DATASET_SCHEMAS.get(file_name))
+        memory_reports[(bucket_name, file_name, columns)] = report
+        logger.info('%s/%s: %.1f MB -> %.1f MB after dtype optimization', bucket_name, file_name,
+                    report['before_bytes'] / 2**20, report['after_bytes'] / 2**20)
+        if prepare is not None:
+            data = prepare(data)
+        return ReadOnlyFrame(data)
+
+    return _cached(('dataset', bucket_name, file_name, columns, _callable_key(prepare), missing_ok),
+                   _missing_as_none(load, missing_ok))
+
+
+def get_artifact(bucket_name, key, loader, missing_ok=False):
+    """Process-wide cached `loader(path)` over the local snapshot of an object.
+
+    `missing_ok` works as in get_dataset.
+    """
+    return _cached(('artifact', bucket_name, key, _callable_key(loader), missing_ok),
+                   _missing_as_none(lambda: loader(_fetch(bucket_name, key)), missing_ok))
+
+
+def object_version(bucket_name, key):
+    """The version of the object the cached values loaded from it were read at, or None."""
+    source = ('object', bucket_name, key)
+    with _cache_lock:
+        for entry in _cache.values():
+            if entry.sources.get(source) is not None:
+                return entry.sources[source]
+    return None
+
+
+def partition_values(key):
+    """Hive partition values encoded in an object key, e.g. {'empresa': 'HOTEL 1', 'year': '2019'}."""
+    return dict(unquote(segment).split('=', 1) for segment in key.split('/')[:-1] if '=' in segment)
+
+
+def list_partition_keys(bucket_name, dataset):
+    """Parquet object keys of a hive-partitioned dataset stored under `dataset/`."""
+    def load():
+        return [key for key in _list_keys(bucket_name, f'{dataset}/') if key.endswith('.parquet')]
+
+    return _cached(('partition_keys', bucket_name, dataset), load)
+
+
+def list_partitions(bucket_name, dataset, partition_key='empresa'):
+    """Distinct values of one partition key, e.g. the hotels of a dataset partitioned by empresa."""
+    keys = list_partition_keys(bucket_name, dataset)
+    return sorted({partition_values(key)[partition_key] for key in keys if partition_key in partition_values(key)})
+
+
+def _read_partition_file(path, key, columns):
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    file_columns = None
+    if columns is not None:
+        file_columns = [column for column in columns if column in parquet_file.schema_arrow.names]
+    table = parquet_file.read(columns=file_columns, use_pandas_metadata=True)
+    for name, value in partition_values(key).items():
+        if name not in table.column_names and (columns is None or name in columns):
+            table = table.append_column(name, pa.array([value] * table.num_rows, pa.string()))
+    if columns is not None:
+        table = table.select([column for column in columns if column in table.column_names])
+    return table
+
+
+def read_partition(bucket_name, dataset, filters, columns=None):
+    """Reads and dtype-optimizes the partitions of `dataset/` matching `filters`, without caching
+    the frame. Partition columns missing from the files are filled in from the object keys.
+    """
+    filters = dict(filters)
+    keys = [key for key in list_partition_keys(bucket_name, dataset)
+            if all(partition_values(key).get(name) == str(value) for name, value in filters.items())]
+    tables = [_read_partition_file(_fetch(bucket_name, key), key, columns) for key in keys]
+    if not tables:
+        raise FileNotFoundError(f'No partitions of {bucket_name}/{dataset} match {filters}')
+    data = pa.concat_tables(tables).to_pandas(split_blocks=True, self_destruct=True)
+    del tables
+    return optimize_dtypes(data, DATASET_SCHEMAS.get(f'{dataset}.parquet'))
+
+
+def get_partition(bucket_name, dataset, filters, columns=None, prepare=None):
+    """Loads only the partitions of `dataset/` matching `filters`, e.g. {'empresa': 'HOTEL 1'}.
+
+    Cached, optimized and prepared like get_dataset.
+    """
+    if columns is not None:
+        columns = tuple(columns)
+    filters = tuple(sorted(filters.items()))
+
+    def load():
+        data, report = read_partition(bucket_name, dataset, filters, columns)
+        memory_reports[(bucket_name, f'{dataset}/{dict(filters)}', columns)] = report
+        if prepare is not None:
+            data = prepare(data)
+        return ReadOnlyFrame(data)
+
+    return _cached(('partition', bucket_name, dataset, filters, columns, _callable_key(prepare)), load)
+
+
+def get_value(cache_key, load):
+    """Process-wide cached `load()` for small values computed from bucket data, e.g. summaries.
+
+    Refreshed in the background like datasets when the objects `load` read change.
+    """
+    return _cached(('value',) + tuple(cache_key), load)
+
+
+def write_partitioned(data, root_path, partition_cols=('empresa', 'year')):
+    """Writes a frame as a hive-partitioned parquet dataset (empresa=.../year=.../*.parquet).
+
+    `year` is derived from fecha_reservacion when it is not a column already. Upload the
+    resulting directory next to the single-file dataset, e.g. as tcadata/reservaciones_dashboard/.
+    """
+    if 'year' in partition_cols and 'year' not in data.columns:
+        data = data.assign(year=data['fecha_reservacion'].dt.year)
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    pq.write_to_dataset(table, root_path, partition_cols=list(partition_cols))
+
+
+def get_derived(data, name, builder):
+    """`builder(data)` computed once per cached frame and shared like the frame itself.
+
+    Entries are dropped when the frame is garbage collected, e.g. after a reload.
+    """
+    derived_key = (id(data), name)
+    with _cache_lock:
+        entry = _derived.get(derived_key)
+    if entry is not None and entry[0]() is data:
+        return entry[1]
+
+    def build():
+        value = builder(data)
+        with _cache_lock:
+            _derived[derived_key] = (weakref.ref(data, lambda _: _derived.pop(derived_key, None)), value, builder)
+        return value
+
+    return _flight.do(('derived',) + derived_key, build)
+
+
+def _derived_builders(data):
+    """(name, builder) of every derived value currently built from `data`."""
+    with _cache_lock:
+        return [(name, entry[2]) for (data_id, name), entry in _derived.items()
+                if data_id == id(data) and entry[0]() is data]
+
+
+def _prefetch(load):
+    try:
+        load()
+    except Exception:
+        # The page repeats the load in the foreground and reports the error there.
+        logger.exception('Prefetch failed')
+
+
+def prefetch(loads):
+    """Starts every zero-argument load in the background pool and returns their futures.
+
+    Loads go through the same cache and single-flight as the pages, so a page that asks for the
+    same data while it is still loading waits for the prefetch instead of fetching it again.
+    """
+    return [_prefetch_pool.submit(_prefetch, load) for load in loads]
+
+
+def clear_cache():
+    """Drops every in-memory dataset, artifact and derived value (snapshots on disk are kept)."""
+    with _cache_lock:
+        _cache.clear()
+        _derived.clear()
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+
+def compact_number(num):
+    if num >= 1_000_000:
+        compact_num = f'{num / 1_000_000:.2f}M'
+    elif num >= 1_000:
+        compact_num = f'{num / 1_000:.2f}K'
+    else:
+        compact_num = f'{num:.2f}'
+
+    compact_num = compact_num.rstrip('0').rstrip('.')
+    return compact_num
+
+
+def compact_numbers(values, prefix='', suffix=''):
+    """Vectorized compact_number over an array or Series; returns strings of the same shape."""
+    array = np.asarray(values, dtype='float64')
+    millions = array >= 1_000_000
+    thousands = (array >= 1_000) & ~millions
+    plain = ~(millions | thousands)
+    scaled = np.where(millions, array / 1_000_000, np.where(thousands, array / 1_000, array))
+
+    text = np.char.mod('%.2f', scaled)
+    # Like compact_number, trailing zeros are only stripped when there is no K/M unit.
+    text = np.where(plain, np.char.rstrip(np.char.rstrip(text, '0'), '.'), text)
+    text = np.char.add(text, np.where(millions, 'M', np.where(thousands, 'K', '')))
+    text = np.char.add(np.char.add(prefix, text), suffix)
+    return _like(values, text)
+
+
+def compact_currency(values):
+    return compact_numbers(values, prefix='$')
+
+
+def percent(values, decimals=1):
+    text = np.char.mod(f'%.{decimals}f%%', np.asarray(values, dtype='float64'))
+    return _like(values, text)
+
+
+def _like(values, text):
+    if isinstance(values, pd.Series):
+        return pd.Series(text, index=values.index, name=values.name, dtype=object)
+    if np.ndim(text) == 0:
+        # A scalar in, a plain str out.
+        return str(text)
+    return text
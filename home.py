@@ -2,135 +2,268 @@ import streamlit as st
 import streamlit_shadcn_ui as ui
 import pandas as pd
 from local_components import card_container
+from concurrent.futures import ThreadPoolExecutor
+from data_access import get_dataset, get_derived, get_partition, get_value, list_partitions, read_partition
+from aggregates import (add_calendar_index, available_months, available_years, build_revenue_cube, month_label,
+                        monthly_revenue, period_slice, revenue_by, revenue_totals, reservations_by_status)
+from formatting import compact_currency, compact_number, compact_numbers, percent
+from profiling import PageProfiler, begin_fragment_rerun
+from churn import CHURN_WINDOWS, ChurnEngine, churn_curves
+from clients import CLIENT_MEASURES, ClientIndex
+from sections import fragment, memoize_section
+from charts import SCATTER_EXACT_THRESHOLD, density_grid, vega_aggregate
 import plotly.express as px
-import boto3
-import io
+import plotly.graph_objects as go
 
 
-def compact_number(num):
-    if num >= 1_000_000:
-        compact_num = f'{num / 1_000_000:.2f}M'
-    elif num >= 1_000:
-        compact_num = f'{num / 1_000:.2f}K'
+RESERVATION_COLUMNS = ['empresa', 'fecha_reservacion', 'reservacion', 'tfa_total', 'num_noches',
+                       'tipo_habitacion', 'canal', 'paquete', 'pais', 'agencia', 'segmento',
+                       'estatus_reservacion']
+NOCHES_DISTRIBUTION_SPEC = {
+    'mark': {'type':'bar', 'fill': 'rgb(166,232,246)'},
+    'encoding': {
+        'x': {'field': 'num_noches', 'bin':{'maxbins': 50}, 'axis': {'title': 'Número de Noches Menores a 20 días'}},
+        'y': {'aggregate': 'count', 'axis': {'title': 'Conteo'}}
+    }
+}
+
+COMPARISON_WORKERS = 8
+
+
+def list_hotels(bucket_name):
+    """Hotels discovered from the empresa partitions, or from the single-file dataset."""
+    hotels = list_partitions(bucket_name, 'reservaciones_dashboard')
+    if hotels:
+        return hotels
+    data = get_dataset(bucket_name, 'reservaciones_dashboard.parquet', columns=RESERVATION_COLUMNS,
+                       prepare=add_calendar_index)
+    return get_derived(data, 'hotels', lambda data: sorted(data['empresa'].dropna().unique().tolist()))
+
+
+def _partitioned(bucket_name):
+    return bool(list_partitions(bucket_name, 'reservaciones_dashboard'))
+
+
+def hotel_reservations(bucket_name, hotel):
+    """Reservations for a hotel: only its partitions when the bucket holds the hive-partitioned
+    dataset, otherwise the full single-file dataset, filtered later by empresa.
+    """
+    if _partitioned(bucket_name):
+        return get_partition(bucket_name, 'reservaciones_dashboard', {'empresa': hotel}, columns=RESERVATION_COLUMNS,
+                             prepare=add_calendar_index)
+    return get_dataset(bucket_name, 'reservaciones_dashboard.parquet', columns=RESERVATION_COLUMNS,
+                       prepare=add_calendar_index)
+
+
+def hotel_churn(bucket_name, hotel):
+    if _partitioned(bucket_name):
+        return get_partition(bucket_name, 'features_dashboard', {'empresa': hotel}, prepare=add_calendar_index)
+    return get_dataset(bucket_name, 'features_dashboard.parquet', prepare=add_calendar_index)
+
+
+def hotel_datasets(bucket_name, hotel):
+    return hotel_reservations(bucket_name, hotel), hotel_churn(bucket_name, hotel)
+
+
+def prefetch_loads(bucket_name):
+    """Loads for the hotel the page opens on, run by main's post-login prefetch."""
+    def reservations():
+        data = hotel_reservations(bucket_name, list_hotels(bucket_name)[0])
+        get_derived(data, 'revenue_cube', build_revenue_cube)
+
+    return [reservations, lambda: hotel_churn(bucket_name, list_hotels(bucket_name)[0])]
+
+
+def hotel_summary(bucket_name, hotel):
+    """Totals for one hotel. With partitions only the few columns needed are read, and only the
+    summary is cached, so comparing hotels does not keep every hotel's data in memory.
+    """
+    if _partitioned(bucket_name):
+        partition = {'empresa': hotel}
+        reservations, _ = read_partition(bucket_name, 'reservaciones_dashboard', partition,
+                                         columns=['reservacion', 'tfa_total'])
+        clients, _ = read_partition(bucket_name, 'features_dashboard', partition, columns=['id_cliente'])
     else:
-        compact_num = f'{num:.2f}'
-    
-    compact_num = compact_num.rstrip('0').rstrip('.')
-    return compact_num
+        reservations = hotel_reservations(bucket_name, hotel)
+        reservations = reservations[reservations['empresa'] == hotel]
+        clients = hotel_churn(bucket_name, hotel)
+        clients = clients[clients['empresa'] == hotel]
+    return {
+        'Hotel': hotel,
+        'Reservaciones Exitosas': int((reservations['reservacion'] == 1).sum()),
+        'Cancelaciones Totales': int((reservations['reservacion'] == 0).sum()),
+        'Tarifa Total': reservations['tfa_total'].sum(),
+        'Clientes': int(clients['id_cliente'].nunique()),
+    }
+
+
+def compare_hotels(bucket_name, hotels):
+    """Per-hotel totals, each computed in its own worker and cached on its own."""
+    def summary(hotel):
+        return get_value(('hotel_summary', bucket_name, hotel), lambda: hotel_summary(bucket_name, hotel))
+
+    with ThreadPoolExecutor(max_workers=min(COMPARISON_WORKERS, len(hotels))) as pool:
+        return pd.DataFrame(list(pool.map(summary, hotels)))
+
+
+def hotel_rows(frame, filters):
+    selected_hotel, year, month = filters
+    rows = period_slice(frame, year, month)
+    return rows[rows['empresa'] == selected_hotel]
+
+
+def reserved_rows(data, filters):
+    rows = hotel_rows(data, filters)
+    return rows[rows['reservacion'] == 1]
 
-ONE_DAY_SECONDS = 86400
 
-@st.cache_data(ttl=ONE_DAY_SECONDS)
-def get_s3_data(bucket_name, file_name):
-    s3 = boto3.resource('s3')
-    obj = s3.Object(bucket_name, file_name)
-    body = obj.get()['Body'].read()
-    data = pd.read_parquet(io.BytesIO(body), engine='pyarrow')
-    return data
+def revenue_breakdowns(cube, filters):
+    breakdowns = {dimension: revenue_by(cube, dimension, *filters)
+                  for dimension in ['tipo_habitacion', 'canal', 'paquete', 'pais', 'agencia', 'segmento']}
+    breakdowns['totals'] = revenue_totals(cube, *filters)
+    breakdowns['monthly'] = monthly_revenue(cube, *filters)
+    breakdowns['status'] = reservations_by_status(cube, *filters)
+    return breakdowns
+
+
+def top_clients_table(index, filters):
+    top_clients = index.top(*filters, k=10)
+    top_clients = top_clients[['id_cliente', 'empresa', 'fecha_reservacion'] + CLIENT_MEASURES]
+    top_clients['id_cliente'] = top_clients['id_cliente'].astype(str)
+
+    for column in CLIENT_MEASURES:
+        top_clients[column] = compact_numbers(top_clients[column])
+    return top_clients.astype(str)
+
+
+def tarifa_noches_figure(reservations):
+    reservations = reservations[reservations['num_noches'] < 100]
+    if len(reservations) <= SCATTER_EXACT_THRESHOLD:
+        fig_scatter = px.scatter(reservations, x='num_noches', y='tfa_total', color_discrete_sequence=['rgb(166,232,246)'])
+    else:
+        # Too many markers to ship to the browser: send a server-side density grid instead.
+        x_centers, y_centers, counts = density_grid(reservations['num_noches'], reservations['tfa_total'])
+        fig_scatter = go.Figure(go.Heatmap(x=x_centers, y=y_centers, z=counts, colorscale='blues',
+                                           colorbar=dict(title='Reservaciones')))
+    fig_scatter.update_layout(xaxis_title='Número de Noches', yaxis_title='Tarifa Total')
+    return fig_scatter
+
+
+@fragment
+def churn_section(churn_data, filters):
+    """Churn rate card and curve. Its widgets only rerun this fragment, not the whole page."""
+    begin_fragment_rerun()
+    profiler = PageProfiler('home')
+    profiler.stage('fragment.churn')
+    # hotel_rows is a slice of the date-sorted frame, so the engine gets sorted timestamps.
+    churn_engine = memoize_section('churn_engine', churn_data, filters,
+                                   lambda: ChurnEngine(hotel_rows(churn_data, filters)['fecha_reservacion']))
+
+    with card_container(key="card_churn"):
+        cols = st.columns(3)
+        with cols[0]:
+            date_pick = st.date_input('Selecciona Fecha para Churn Rate', value=pd.to_datetime('2020-04-30'))
+        with cols[1]:
+            selected_delta = st.selectbox('Selecciona Periodo para Churn Rate', list(CHURN_WINDOWS))
+        number_of_days = CHURN_WINDOWS[selected_delta]
+        profiler.widgets.update(churn_date=str(date_pick), churn_period=selected_delta)
+
+        churn_rate = churn_engine.rate(date_pick, number_of_days)
+        with cols[2]:
+            ui.card(title="Tasa de Churn", content=percent(churn_rate), key="card4").render()
+
+    if len(churn_engine):
+        churn_over_time = churn_curves(churn_engine, churn_engine.last_reservations[0],
+                                       max(pd.Timestamp(date_pick), pd.Timestamp(churn_engine.last_reservations[-1])))
+        with card_container(key="chart_churn"):
+            st.subheader('Tasa de Churn en el Tiempo')
+            fig_churn = px.line(churn_over_time, x='Fecha', y='Churn', color='Periodo')
+            fig_churn.update_layout(xaxis_title='Fecha de Referencia', yaxis_title='Tasa de Churn (%)')
+            st.plotly_chart(fig_churn, use_container_width=True)
+    profiler.finish()
+
 
 def app():
     st.title('Tablero de Ingresos de Reservaciones de Hotel')
 
     bucket_name = 'tcadata'
+    profiler = PageProfiler('home')
+    profiler.stage('load')
     
-    data = get_s3_data(bucket_name, 'reservaciones_dashboard.parquet')
-    churn_data = get_s3_data(bucket_name, 'features_dashboard.parquet')
+    hotels = list_hotels(bucket_name)
+    selected_hotel = st.sidebar.selectbox('Selecciona Hotel', hotels)
+    data, churn_data = hotel_datasets(bucket_name, selected_hotel)
+    cube = get_derived(data, 'revenue_cube', build_revenue_cube)
     
-    selected_hotel = st.sidebar.selectbox('Selecciona Hotel', ['HOTEL 1'])
-    filtered_data = data[data['empresa'] == selected_hotel].copy()
-    filtered_churn = churn_data[churn_data['empresa'] == selected_hotel].copy()
-
-    years = [2019, 2020, 'Todos']
+    profiler.stage('filter')
+    years = available_years(cube, selected_hotel) + ['Todos']
 
     selected_year = st.sidebar.selectbox('Selecciona Año', years)
+    cube_year = None if selected_year == "Todos" else selected_year
 
-    if selected_year != "Todos":
-        year_data = data[data['fecha_reservacion'].dt.year == selected_year]
-        months = year_data['fecha_reservacion'].dt.month_name().unique()
-        months = sorted(months, key=lambda x: pd.to_datetime(x, format='%B').month)
-    else:
-        months = data['fecha_reservacion'].dt.month_name().unique()
-        months = sorted(months, key=lambda x: pd.to_datetime(x, format='%B').month)
-
-    months.insert(0, "Todos")
-    selected_month = st.sidebar.selectbox('Selecciona Mes', months, disabled=(selected_year == "Todos"))
-
-    if selected_year != "Todos":
-        if selected_month != "Todos":
-            month_number = pd.to_datetime(selected_month, format='%B').month
-            filtered_data = data[(data['fecha_reservacion'].dt.year == selected_year) & 
-                                 (data['fecha_reservacion'].dt.month == month_number)].copy()
-            filtered_churn = churn_data[(churn_data['fecha_reservacion'].dt.year == selected_year) &
-                                        (churn_data['fecha_reservacion'].dt.month == month_number)].copy()
-        else:
-            filtered_data = data[data['fecha_reservacion'].dt.year == selected_year].copy()
-            filtered_churn = churn_data[churn_data['fecha_reservacion'].dt.year == selected_year].copy()
-    else:
-        filtered_data = data.copy()
-        filtered_churn = churn_data.copy()
-
-    date_pick = st.sidebar.date_input('Selecciona Fecha para Churn Rate', value=pd.to_datetime('2020-04-30'))
-    selected_delta = st.sidebar.selectbox('Selecciona Periodo para Churn Rate', ['1 año', '6 meses', '3 meses', '1 mes'])
-
-    delta_mapping = {
-        '1 año': 365,
-        '6 meses': 180,
-        '3 meses': 90,
-        '1 mes': 30
-    }
-    number_of_days = delta_mapping[selected_delta]
-
-    filtered_churn.loc[:, 'time_since_last_res'] = (pd.to_datetime(date_pick) - filtered_churn['fecha_reservacion']).dt.days.astype(int)
-    filtered_churn.loc[:, 'churn'] = filtered_churn['time_since_last_res'] > number_of_days
+    months = ["Todos"] + available_months(cube, selected_hotel, cube_year)
+    selected_month = st.sidebar.selectbox('Selecciona Mes', months, format_func=month_label,
+                                          disabled=(selected_year == "Todos"))
+    cube_month = None if cube_year is None or selected_month == "Todos" else selected_month
 
-    total_cancelaciones = filtered_data[filtered_data['reservacion'] == 0].shape[0]
-    total_reservaciones = filtered_data[filtered_data['reservacion'] == 1].shape[0]
-    tarifa_total = filtered_data['tfa_total'].sum()
+    profiler.widgets.update(hotel=selected_hotel, year=selected_year, month=selected_month)
+    # Every section below reads only these filters; memoize_section skips sections whose
+    # filters did not change since this session's last run.
+    filters = (selected_hotel, cube_year, cube_month)
 
-    churn_rate = filtered_churn['churn'].sum() / len(filtered_churn) * 100
+    profiler.stage('aggregate.revenue_breakdowns')
+    breakdowns = memoize_section('revenue_breakdowns', data, filters, lambda: revenue_breakdowns(cube, filters))
+    total_cancelaciones, total_reservaciones, tarifa_total = breakdowns['totals']
 
-    cols = st.columns(4)
+    profiler.stage('render.kpis')
+    cols = st.columns(3)
     with cols[0]:
         ui.card(title="Cancelaciones Totales", content=compact_number(total_cancelaciones), key="card1").render()
     with cols[1]:
         ui.card(title="Reservaciones Exitosas", content=compact_number(total_reservaciones), key="card2").render()
     with cols[2]:
         ui.card(title="Tarifa Total", content=f"${compact_number(tarifa_total)}", key="card3").render()
-    with cols[3]:
-        ui.card(title="Tasa de Churn", content=f"{churn_rate:.1f}%", key="card4").render()
 
-    filtered_data = filtered_data[filtered_data['reservacion'] == 1].copy()
-    filtered_data.loc[:, 'YearMonth'] = filtered_data['fecha_reservacion'].dt.to_period('M').astype(str)
-    aggregated_data = filtered_data.groupby('YearMonth')['tfa_total'].sum().reset_index()
+    # The fragment records its own span.
+    profiler.finish()
+    churn_section(churn_data, filters)
 
-    aggregated_data.columns = ['Date', 'Total_TFA']
+    profiler.stage('chart.monthly_revenue')
+    aggregated_data = breakdowns['monthly']
 
     with card_container(key="chart1"):
         st.subheader('Ingresos Mensuales')
-        st.vega_lite_chart(aggregated_data, {
+        st.vega_lite_chart(*vega_aggregate(aggregated_data, {
             'mark': {'type': 'bar', 'tooltip': True, 'fill': 'rgb(166,232,246)', 'cornerRadiusEnd': 4 },
             'encoding': {
                 'x': {'field': 'Date', 'type': 'ordinal', 'axis': {'title': 'Date (Month and Year)'}},
                 'y': {'field': 'Total_TFA', 'type': 'quantitative', 'axis': {'title': 'Tarifa Total'}},
             },
-        }, use_container_width=True)
+        }), use_container_width=True)
 
-    room_type_revenue = filtered_data.groupby('tipo_habitacion')['tfa_total'].sum().reset_index()
-    canal_revenue = filtered_data.groupby('canal')['tfa_total'].sum().reset_index()
-
-    top_clients = filtered_churn.sort_values(by='total_expense', ascending=False).head(10)
-
-    top_clients['id_cliente'] = top_clients['id_cliente'].astype(int)
-    top_clients['id_cliente'] = top_clients['id_cliente'].astype(str)
-
-    for column in top_clients.select_dtypes(include=['int64', 'float64']).columns:
-        top_clients[column] = top_clients[column].apply(compact_number)  
+    room_type_revenue = breakdowns['tipo_habitacion']
+    canal_revenue = breakdowns['canal']
 
+    profiler.stage('aggregate.top_clients')
+    client_index = get_derived(churn_data, 'client_index', ClientIndex)
+    top_clients = memoize_section('top_clients', churn_data, filters,
+                                  lambda: top_clients_table(client_index, filters))
 
+    profiler.stage('render.top_clients')
     with card_container(key="chart10"):
         st.subheader('Top 10 Clientes con Mayor Gasto')
-        ui.table(top_clients.astype(str))
-
+        ui.table(top_clients)
+
+        client_id = st.text_input('Buscar cliente por id_cliente').strip()
+        if client_id:
+            if client_id.isdigit() and int(client_id) in client_index:
+                history = client_index.history(churn_data, int(client_id))
+                st.dataframe(history[['empresa', 'fecha_reservacion'] + CLIENT_MEASURES], hide_index=True,
+                             use_container_width=True)
+            else:
+                st.caption(f'No se encontró el cliente {client_id}.')
+
+    profiler.stage('chart.treemaps')
     fig1 = px.treemap(room_type_revenue, 
                       path=[px.Constant("Todos"), 'tipo_habitacion'], 
                       values='tfa_total')
@@ -150,14 +283,16 @@ def app():
                 st.subheader('Ingresos por Canal')
                 st.plotly_chart(fig2, use_container_width=True)
 
-    package_revenue = filtered_data.groupby('paquete')['tfa_total'].sum().reset_index()
+    profiler.stage('aggregate.tables')
+    package_revenue = breakdowns['paquete']
     package_revenue = package_revenue.sort_values('tfa_total', ascending=False)
-    package_revenue['tfa_total'] = package_revenue['tfa_total'].apply(compact_number)
+    package_revenue['tfa_total'] = compact_numbers(package_revenue['tfa_total'])
 
-    country_revenue = filtered_data.groupby('pais')['tfa_total'].sum().reset_index()
+    country_revenue = breakdowns['pais']
     country_revenue = country_revenue.sort_values('tfa_total', ascending=False)
-    country_revenue['tfa_total'] = country_revenue['tfa_total'].apply(lambda x: f"${compact_number(x)}")
+    country_revenue['tfa_total'] = compact_currency(country_revenue['tfa_total'])
 
+    profiler.stage('render.tables')
     with card_container(key="table2"):
         cols = st.columns(2)
         with cols[0]:
@@ -167,18 +302,19 @@ def app():
             st.subheader('Ingresos por País')
             ui.table(country_revenue.head())
 
-    agency_revenue = filtered_data.groupby('agencia')['tfa_total'].sum().reset_index()
+    profiler.stage('aggregate.agency_status')
+    agency_revenue = breakdowns['agencia']
     top_10_agency_revenue = agency_revenue.nlargest(10, 'tfa_total').sort_values('tfa_total', ascending=True)
 
-    status_reservations = filtered_data['estatus_reservacion'].value_counts().reset_index()
-    status_reservations.columns = ['estatus_reservacion', 'num_reservations']
+    status_reservations = breakdowns['status']
 
+    profiler.stage('chart.agency_segment')
     with card_container(key="chart5"):
         cols = st.columns(2)
         with cols[0]:
             st.subheader('Ingresos por Agencia (Top 10)')
             st.subheader('    ')
-            st.vega_lite_chart(top_10_agency_revenue, {
+            st.vega_lite_chart(*vega_aggregate(top_10_agency_revenue, {
                 'width': 'container',
                 'height': 550,
                 'mark': {
@@ -206,10 +342,10 @@ def app():
                     'view': {'stroke': 'transparent'},
                     'padding': {'left': 200, 'right': 10, 'top': 10, 'bottom': 10}
                 }
-            }, use_container_width=True)
+            }), use_container_width=True)
         with cols[1]:
 
-            segment_revenue = filtered_data.groupby('segmento')['tfa_total'].sum().reset_index()
+            segment_revenue = breakdowns['segmento']
             fig3 = px.treemap(segment_revenue, 
                         path=[px.Constant("Todos"), 'segmento'], 
                         values='tfa_total')
@@ -217,6 +353,7 @@ def app():
             st.subheader('Ingresos por Segmento ')
             st.plotly_chart(fig3, use_container_width=True)   
 
+    profiler.stage('chart.status')
     with card_container(key="chart5"):
         st.subheader('Estatus de Reservaciones')
         fig = px.pie(status_reservations, values='num_reservations', names='estatus_reservacion', hole=0.5)
@@ -229,20 +366,29 @@ def app():
         st.plotly_chart(fig, use_container_width=False)
 
 
+    profiler.stage('chart.tarifa_noches')
+    fig_scatter = memoize_section('tarifa_noches', data, filters,
+                                  lambda: tarifa_noches_figure(reserved_rows(data, filters)))
     with card_container(key="chart6"):
-        filtered_data = filtered_data[filtered_data['num_noches'] < 100].copy()
         st.subheader('Relación entre Tarifa Total y Número de Noches')
-        fig_scatter = px.scatter(filtered_data, x='num_noches', y='tfa_total', color_discrete_sequence=['rgb(166,232,246)'])
-        fig_scatter.update_layout(xaxis_title='Número de Noches', yaxis_title='Tarifa Total')
         st.plotly_chart(fig_scatter, use_container_width=True)
 
+    profiler.stage('chart.noches_distribution')
+    noches_distribution = memoize_section(
+        'noches_distribution', data, filters,
+        lambda: vega_aggregate(reserved_rows(data, filters).query('num_noches < 20'), NOCHES_DISTRIBUTION_SPEC))
     with card_container(key="chart7"):
-        filtered_data = filtered_data[filtered_data['num_noches'] < 20].copy()
         st.subheader('Distribución del Número de Noches')
-        st.vega_lite_chart(filtered_data, {
-            'mark': {'type':'bar', 'fill': 'rgb(166,232,246)'},
-            'encoding': {
-                'x': {'field': 'num_noches', 'bin':{'maxbins': 50}, 'axis': {'title': 'Número de Noches Menores a 20 días'}},
-                'y': {'aggregate': 'count', 'axis': {'title': 'Conteo'}}
-            }
-        }, use_container_width=True)
+        st.vega_lite_chart(*noches_distribution, use_container_width=True)
+
+    if len(hotels) > 1 and st.toggle('Mostrar comparativo entre hoteles'):
+        profiler.stage('aggregate.hotel_comparison')
+        comparison = compare_hotels(bucket_name, hotels)
+        with card_container(key="chart8"):
+            st.subheader('Comparativo entre Hoteles')
+            fig_hotels = px.bar(comparison, x='Hotel', y='Tarifa Total', color_discrete_sequence=['rgb(166,232,246)'])
+            st.plotly_chart(fig_hotels, use_container_width=True)
+            comparison['Tarifa Total'] = compact_currency(comparison['Tarifa Total'])
+            ui.table(comparison.astype(str))
+
+    profiler.finish()
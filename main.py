@@ -1,48 +1,32 @@
 import streamlit as st
 import streamlit_authenticator as stauth  # pip install streamlit-authenticator
 from streamlit_option_menu import option_menu
-import os
-import yaml
-from yaml.loader import SafeLoader
-import boto3
-import json
+import copy
 
 import home, model
+from data_access import enable_copy_on_write, prefetch
+from secrets_config import get_config
+from profiling import begin_rerun, render_profiler_panel, span
 
 
+enable_copy_on_write()
+
 st.set_page_config(
         page_title="TCA",
         layout="wide",
 )
 
-def get_secret():
-    secret_name = "your-secret-name"  # Replace with your secret name
-    region_name = "your-aws-region"  # Replace with your AWS region
-    # Create a Secrets Manager client
-    client = boto3.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-    except Exception as e:
-        print(f"Error retrieving secret: {e}")
-        return None
-    secret = get_secret_value_response['SecretString']
-    return json.loads(secret)
-
 def login():
-    secret_config = get_secret()
-    if not secret_config:
+    config = get_config()
+    if not config:
         st.error("Could not retrieve the secret configuration.")
         return None, None, None, None
 
-    config = yaml.load(secret_config["config.yaml"], Loader=SafeLoader)
-
+    # The authenticator renders its cookie component and keeps login state in the credentials,
+    # so it is built per rerun from a private copy of the cached config.
+    credentials = copy.deepcopy(config['credentials'])
     authenticator = stauth.Authenticate(
-        config['credentials'],
+        credentials,
         config['cookie']['name'],
         config['cookie']['key'],
         config['cookie']['expiry_minutes'],
@@ -53,6 +37,12 @@ def login():
 
     return authenticator, name, authentication_status, username
 
+def prefetch_pages(bucket_name='tcadata'):
+    # Once per session: warm every page's data while the first one renders.
+    if not st.session_state.get('prefetched'):
+        prefetch(home.prefetch_loads(bucket_name) + model.prefetch_loads(bucket_name))
+        st.session_state['prefetched'] = True
+
 def logout(authenticator):
     with st.sidebar.container(border=True):
         st.subheader('Logout')
@@ -77,9 +67,12 @@ class MultiApp:
 
     def run():
 
-        authenticator, name, authentication_status, username = login()
+        begin_rerun()
+        with span('main', 'login'):
+            authenticator, name, authentication_status, username = login()
 
         if authentication_status:
+            prefetch_pages()
 
             # app = st.sidebar(
             with st.sidebar: 
@@ -105,6 +98,8 @@ class MultiApp:
             if app == "Modelo":
                 model.app()  
 
+            render_profiler_panel(username)
+
 
 
         elif authentication_status == False:
@@ -1,73 +1,114 @@
 import streamlit as st
 import streamlit_shadcn_ui as ui
 import pandas as pd
+import numpy as np
 from local_components import card_container
+from data_access import get_artifact, get_dataset, get_derived, object_version
+from profiling import PageProfiler
+from sections import fragment
+from model_artifacts import (feature_columns, load_evaluation, load_model_data, load_permutation_importance,
+                             permutation_key, threshold_metrics)
+from charts import box_summary, downsample_curve, histogram_edges, histogram_summary, vega_aggregate
 import plotly.graph_objects as go
-import boto3
-import io
-import pickle
+from botocore.exceptions import ClientError
 
-from sklearn.metrics import f1_score, accuracy_score,recall_score, roc_curve, auc, precision_recall_curve
 
+DISTRIBUTION_COLUMNS = ['avg_days_between_visits', 'dias_estancia', 'total_rooms_reserved']
+GROUP_COLORS = {'Churn': '#CB2026', 'Repitent': '#a6e7f6'}
+# Written by scoring.py; see its docstring.
+SCORES_KEY = 'churn_scores.parquet'
+AT_RISK_ROWS = 50
+AT_RISK_DETAILS = ['client_key', 'total_reservations', 'total_expense', 'last_reservation']
+
+
+def distribution_summaries(churn_data):
+    """Box and histogram summaries per distribution column for churned vs repitent clients."""
+    groups = {'Churn': churn_data['churn'] == True, 'Repitent': churn_data['churn'] == False}
+    summaries = {}
+    for col in DISTRIBUTION_COLUMNS:
+        values = {label: churn_data.loc[mask, col].to_numpy() for label, mask in groups.items()}
+        # Shared edges so the overlaid histograms line up.
+        edges = histogram_edges(churn_data.loc[groups['Churn'] | groups['Repitent'], col].to_numpy())
+        summaries[col] = {label: {'box': box_summary(group_values), 'hist': histogram_summary(group_values, edges)}
+                          for label, group_values in values.items()}
+    return summaries
+
+
+def at_risk_clients(scores):
+    return scores.nlargest(AT_RISK_ROWS, 'churn_probability')
 
-def compact_number(num):
-    if num >= 1_000_000:
-        compact_num = f'{num / 1_000_000:.2f}M'
-    elif num >= 1_000:
-        compact_num = f'{num / 1_000:.2f}K'
-    else:
-        compact_num = f'{num:.2f}'
-    
-    compact_num = compact_num.rstrip('0').rstrip('.')
-    return compact_num
 
-ONE_DAY_SECONDS = 86400
+def sorted_probabilities(scores):
+    return np.sort(scores['churn_probability'].to_numpy())
 
-@st.cache_data(ttl=ONE_DAY_SECONDS)
-def get_s3_data(bucket_name, file_name):
-    s3 = boto3.resource('s3')
-    obj = s3.Object(bucket_name, file_name)
-    body = obj.get()['Body'].read()
-    data = pd.read_parquet(io.BytesIO(body), engine='pyarrow')
-    return data
 
-@st.cache_data(ttl=ONE_DAY_SECONDS)
-def read_pickle_from_s3(bucket_name: str, key: str):
-    # Create an S3 client
-    s3 = boto3.client('s3')
-    # Download the pickle file from S3
-    s3.download_file(bucket_name, key, '/tmp/temp_model.pkl')
-    # Load the pickle file
-    with open('/tmp/temp_model.pkl', 'rb') as file:
-        model_data = pickle.load(file)
-    return model_data
+@fragment
+def threshold_section(evaluation, client_count, probabilities):
+    """Metrics at a user-chosen decision threshold; reruns alone when the slider moves.
 
+    Flagged clients are counted over churn_scores.parquet when it exists, otherwise extrapolated
+    from the test split to `client_count`.
+    """
+    with card_container(key="threshold"):
+        st.subheader('Explorador de umbral de decisión')
+        threshold = st.slider('Umbral de probabilidad de churn', 0.0, 1.0, 0.5, 0.01)
+        metrics = threshold_metrics(evaluation, threshold)
+        if probabilities is not None:
+            flagged = len(probabilities) - int(np.searchsorted(probabilities, threshold, side='left'))
+        else:
+            flagged = round(metrics['flagged'] / len(evaluation['sorted_scores']) * client_count)
+        # Metrics of the churn class alone, unlike the weighted averages in the cards above.
+        cols = st.columns(4)
+        cols[0].metric('Precisión (clase Churn)', f"{metrics['precision'] * 100:.2f}%")
+        cols[1].metric('Recall (clase Churn)', f"{metrics['recall'] * 100:.2f}%")
+        cols[2].metric('F1-Score (clase Churn)', f"{metrics['f1'] * 100:.2f}%")
+        cols[3].metric('Clientes marcados', f'{flagged:,}')
+        st.dataframe(pd.DataFrame({'Predicho Churn': [metrics['tp'], metrics['fp']],
+                                   'Predicho Repitent': [metrics['fn'], metrics['tn']]},
+                                  index=['Real Churn', 'Real Repitent']), use_container_width=True)
+
+
+def prefetch_loads(bucket_name):
+    """Loads run by main's post-login prefetch."""
+    return [
+        lambda: get_dataset(bucket_name, 'features_model.parquet'),
+        lambda: get_artifact(bucket_name, 'model_data.pkl', load_model_data),
+        lambda: get_artifact(bucket_name, 'model_data.pkl', load_evaluation),
+    ]
 
 
 def app():
     st.title('Resultados del Modelo (GradientBoostingClassifier)')
     bucket_name = 'tcadata'
+    profiler = PageProfiler('model')
+    profiler.stage('load')
     
-    #predicted_data = get_s3_data(bucket_name, 'y_predict.parquet')
-    churn_data = get_s3_data(bucket_name, 'features_model.parquet')
-    #model = get_s3_data(bucket_name, 'modelo_limpio.py')
+    #predicted_data = get_dataset(bucket_name, 'y_predict.parquet')
+    churn_data = get_dataset(bucket_name, 'features_model.parquet')
+    #model = get_dataset(bucket_name, 'modelo_limpio.py')
     #predicted_data = pd.read_csv('y_pred.csv')
 
     key = 'model_data.pkl'
-    model_data = read_pickle_from_s3(bucket_name, key)
+    model_data = get_artifact(bucket_name, key, load_model_data)
+    # A missing scores file is cached as None; other S3 errors (access, throttling) are reported.
+    scores_error = None
+    try:
+        scores = get_dataset(bucket_name, SCORES_KEY, missing_ok=True)
+    except ClientError as e:
+        scores, scores_error = None, e
+    profiler.stage('aggregate.evaluation')
+    # Probabilities, curves and metrics are computed once per model version, not per rerun.
+    evaluation = get_artifact(bucket_name, key, load_evaluation)
 
     # Access the loaded model and data
     model = model_data['model']
-    X_test = model_data['X_test']
-    y_test = model_data['y_test']
-    predicted_data = model_data['y_pred']
-
 
     # Evaluación del modelo
-    accuracy = accuracy_score(y_test, predicted_data) * 100
-    f1 = f1_score(y_test, predicted_data, average='weighted') * 100
-    recall = recall_score(y_test, predicted_data, average='weighted') *100
+    accuracy = evaluation['accuracy_score']
+    f1 = evaluation['f1_score']
+    recall = evaluation['recall_score']
 
+    profiler.stage('render.metrics')
     # MODEL PERFORMANCE
     cols = st.columns(3)
     with cols[0]:
@@ -77,11 +118,11 @@ def app():
     with cols[2]:
         ui.card(title="Recall", content=f"{recall:.2f}%", key="card3").render()
 
-    def plot_roc_curve(model, X_test, y_test):
-        y_pred_proba = model.predict_proba(X_test)[:, 1]
-        fpr, tpr, _ = roc_curve(y_test, y_pred_proba)
-        roc_auc = auc(fpr, tpr)
+    threshold_section(evaluation, len(churn_data),
+                      None if scores is None else get_derived(scores, 'sorted_probabilities', sorted_probabilities))
 
+    def plot_roc_curve(fpr, tpr, roc_auc):
+        fpr, tpr = downsample_curve(fpr, tpr)
         fig = go.Figure()
         fig.add_trace(go.Scatter(x=fpr, y=tpr, mode='lines', name='ROC curve (area = %0.2f)' % roc_auc))
         fig.add_trace(go.Scatter(x=[0, 1], y=[0, 1], mode='lines', name='Chance', line=dict(dash='dash')))
@@ -94,10 +135,8 @@ def app():
         )
         return fig
 
-    def plot_precision_recall_curve(model, X_test, y_test):
-        y_pred_proba = model.predict_proba(X_test)[:, 1]
-        precision, recall, _ = precision_recall_curve(y_test, y_pred_proba)
-
+    def plot_precision_recall_curve(precision, recall):
+        recall, precision = downsample_curve(recall, precision)
         fig = go.Figure()
         fig.add_trace(go.Scatter(x=recall, y=precision, mode='lines', name='Precision-Recall curve'))
         
@@ -109,8 +148,9 @@ def app():
         )
         return fig
 
-    fig_roc_curve = plot_roc_curve(model, X_test, y_test)
-    fig_pr_curve = plot_precision_recall_curve(model, X_test, y_test)
+    profiler.stage('chart.curves')
+    fig_roc_curve = plot_roc_curve(evaluation['fpr'], evaluation['tpr'], evaluation['roc_auc'])
+    fig_pr_curve = plot_precision_recall_curve(evaluation['precision'], evaluation['recall'])
     with card_container(key="chart0"):
         cols = st.columns(2)
         with cols[0]:
@@ -119,27 +159,19 @@ def app():
             st.plotly_chart(fig_pr_curve, use_container_width=True)
 
 # FEATURE IMPORTANCE
+    profiler.stage('chart.feature_importance')
     importances = model.feature_importances_
-    features = churn_data.drop(['churn', 'client_key', 'last_visit', 'last_reservation', 
-                                'time_since_last_res', 'total_people_stayed'], axis=1).columns
-    feature_importances = pd.DataFrame({'Feature': features, 'Importance': importances})
+    names = feature_columns(model_data, churn_data.columns)
+    feature_importances = pd.DataFrame({'Feature': names, 'Importance': importances})
     feature_importances = feature_importances.sort_values(by='Importance', ascending=False)
+    # Uploaded by scoring.py for each model version; the page only reads the result.
+    permutation_importances = get_artifact(bucket_name, permutation_key(object_version(bucket_name, key)),
+                                           load_permutation_importance, missing_ok=True)
+    if permutation_importances is not None:
+        permutation_importances = permutation_importances.assign(Feature=names)
 
-    with card_container(key="chart1"):
-        st.subheader('Importancia de las variables en el modelo')
-        fig_featureimportance = go.Figure(go.Bar(
-            x=feature_importances['Importance'],
-            y=feature_importances['Feature'],
-            orientation='h',
-            marker=dict(color=feature_importances['Importance'], colorscale='blues')
-        ))
-        fig_featureimportance.update_layout(
-            xaxis_title='Importancia',
-            yaxis_title='Variable',
-            yaxis=dict(autorange="reversed")  # To display the most important features at the top
-        )
-        #st.plotly_chart(fig_featureimportance, use_container_width=True)
-        st.vega_lite_chart(feature_importances, {
+    def importance_spec(title):
+        return {
                 'width': 'container',
                 'height': 443,
                 'mark': {
@@ -160,22 +192,39 @@ def app():
                     'x': {
                         'field': 'Importance', 
                         'type': 'quantitative', 
-                        'axis': {'title': 'Importancia'}
+                        'axis': {'title': title}
                     }
                 },
                 'config': {
                     'view': {'stroke': 'transparent'},
                     'padding': {'left': 200, 'right': 10, 'top': 10, 'bottom': 10}
                 }
-            }, use_container_width=True)
+            }
+
+    with card_container(key="chart1"):
+        st.subheader('Importancia de las variables en el modelo')
+        cols = st.columns(2)
+        with cols[0]:
+            st.caption('Por impureza (feature_importances_)')
+            st.vega_lite_chart(*vega_aggregate(feature_importances, importance_spec('Importancia')),
+                               use_container_width=True)
+        with cols[1]:
+            st.caption('Por permutación en el conjunto de prueba')
+            if permutation_importances is None:
+                st.info('La importancia por permutación de esta versión del modelo se genera con `python scoring.py`.')
+            else:
+                st.vega_lite_chart(*vega_aggregate(permutation_importances,
+                                                   importance_spec('Caída de exactitud al permutar')),
+                                   use_container_width=True)
     
-    churn = churn_data[churn_data['churn'] == True].drop(['churn'], axis = 1)
-    repitent = churn_data[churn_data['churn'] == False].drop(['churn'], axis = 1)
+    profiler.stage('aggregate.distributions')
+    summaries = get_derived(churn_data, 'distribution_summaries', distribution_summaries)
 
-    def plot_distributions(df1, df2, col, titulo):
+    def plot_distributions(summary, col, titulo):
         fig = go.Figure()
-        fig.add_trace(go.Histogram(x=df1[col], name='Churn', nbinsx=30, opacity=0.75, marker_color='#CB2026'))
-        fig.add_trace(go.Histogram(x=df2[col], name='Repitent', nbinsx=30, opacity=0.75, marker_color='#a6e7f6'))
+        for label, color in GROUP_COLORS.items():
+            hist = summary[label]['hist']
+            fig.add_trace(go.Bar(x=hist['centers'], y=hist['counts'], width=hist['widths'], name=label, opacity=0.75, marker_color=color))
             
         fig.update_layout(
                 title=titulo,
@@ -188,10 +237,11 @@ def app():
         fig.update_traces(opacity=0.75)
         return fig
 
-    def plot_density(df1, df2, col, titulo):
+    def plot_density(summary, col, titulo):
         fig = go.Figure()
-        fig.add_trace(go.Histogram(x=df1[col], name='Churn', nbinsx=30, opacity=0.5, marker_color='#CB2026', histnorm='probability density'))
-        fig.add_trace(go.Histogram(x=df2[col], name='Repitent', nbinsx=30, opacity=0.5, marker_color='#a6e7f6', histnorm='probability density'))
+        for label, color in GROUP_COLORS.items():
+            hist = summary[label]['hist']
+            fig.add_trace(go.Bar(x=hist['centers'], y=hist['density'], width=hist['widths'], name=label, opacity=0.5, marker_color=color))
             
         fig.update_layout(
             title=titulo,
@@ -207,10 +257,17 @@ def app():
         return fig
 
 
-    def plot_box(df1, df2, col, titulo):
+    def plot_box(summary, col, titulo):
         fig = go.Figure()
-        fig.add_trace(go.Box(y=df1[col], name='Churn', marker_color='#CB2026'))
-        fig.add_trace(go.Box(y=df2[col], name='Repitent', marker_color='#a6e7f6'))
+        for label, color in GROUP_COLORS.items():
+            stats = summary[label]['box']
+            if stats is None:
+                continue
+            fig.add_trace(go.Box(x=[label], q1=[stats['q1']], median=[stats['median']], q3=[stats['q3']],
+                                 lowerfence=[stats['lowerfence']], upperfence=[stats['upperfence']],
+                                 name=label, marker_color=color, boxpoints=False))
+            fig.add_trace(go.Scatter(x=[label] * len(stats['outliers']), y=stats['outliers'], mode='markers',
+                                     name=label, marker_color=color, showlegend=False))
             
         fig.update_layout(
             title=titulo,
@@ -221,10 +278,11 @@ def app():
         )
         return fig
 
+    profiler.stage('chart.distributions')
     # Example usage with columns
-    fig_dist_roomtype = plot_box(churn, repitent, 'avg_days_between_visits', 'Por días estre reservaciones')
-    fig_dist_estancia = plot_box(churn, repitent, 'dias_estancia', 'Por tiempo de estancia')
-    fig_dist_expense = plot_box(churn, repitent, 'total_rooms_reserved', 'Por cuartos reservados')
+    fig_dist_roomtype = plot_box(summaries['avg_days_between_visits'], 'avg_days_between_visits', 'Por días estre reservaciones')
+    fig_dist_estancia = plot_box(summaries['dias_estancia'], 'dias_estancia', 'Por tiempo de estancia')
+    fig_dist_expense = plot_box(summaries['total_rooms_reserved'], 'total_rooms_reserved', 'Por cuartos reservados')
 
     with card_container(key="chart2"):
         st.subheader('Distribuciones de variables')
@@ -234,4 +292,27 @@ def app():
         with cols[1]:
             st.plotly_chart(fig_dist_roomtype, use_container_width=True)
         with cols[2]:
-            st.plotly_chart(fig_dist_estancia, use_container_width=True)
\ No newline at end of file
+            st.plotly_chart(fig_dist_estancia, use_container_width=True)
+
+    profiler.stage('render.at_risk')
+    with card_container(key="chart3"):
+        st.subheader('Clientes en riesgo de churn')
+        if scores_error is not None:
+            st.warning(f'No se pudieron leer las puntuaciones de churn: {scores_error}')
+        elif scores is None:
+            st.caption('Aún no hay puntuaciones de churn; se generan con `python scoring.py`.')
+        else:
+            at_risk = get_derived(scores, 'at_risk_clients', at_risk_clients)
+            details = churn_data.loc[churn_data['client_key'].isin(at_risk['client_key']), AT_RISK_DETAILS]
+            at_risk = at_risk.merge(details, on='client_key', how='left')
+            st.dataframe(at_risk.rename(columns={
+                'client_key': 'Cliente',
+                'churn_probability': 'Probabilidad de Churn',
+                'total_reservations': 'Reservaciones',
+                'total_expense': 'Gasto Total',
+                'last_reservation': 'Última Reservación',
+            }), hide_index=True, use_container_width=True,
+                column_config={'Probabilidad de Churn': st.column_config.ProgressColumn(
+                    'Probabilidad de Churn', format='%.2f', min_value=0, max_value=1)})
+
+    profiler.finish()
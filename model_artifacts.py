@@ -0,0 +1,205 @@
+import json
+import os
+import pickle
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.inspection import permutation_importance
+from sklearn.metrics import accuracy_score, auc, f1_score, precision_recall_curve, recall_score, roc_curve
+
+
+ARRAY_KEYS = ('X_test', 'y_test', 'y_pred')
+# Bump when evaluate_model's outputs change so stored bundles are recomputed.
+EVALUATION_VERSION = 2
+# Columns of features_model.parquet that are not model inputs.
+NON_FEATURE_COLUMNS = ('churn', 'client_key', 'last_visit', 'last_reservation', 'time_since_last_res',
+                       'total_people_stayed')
+PERMUTATION_REPEATS = 5
+# Rows of X_test permuted per repeat; larger test splits are subsampled.
+PERMUTATION_MAX_SAMPLES = 50_000
+
+
+def _to_array(value):
+    if isinstance(value, pd.DataFrame):
+        return value.to_numpy(), {'kind': 'frame', 'columns': [str(c) for c in value.columns]}
+    if isinstance(value, pd.Series):
+        return value.to_numpy(), {'kind': 'series', 'name': value.name}
+    return np.asarray(value), {'kind': 'array'}
+
+
+def _from_array(array, meta):
+    if meta['kind'] == 'frame':
+        return pd.DataFrame(array, columns=meta['columns'], copy=False)
+    if meta['kind'] == 'series':
+        return pd.Series(array, name=meta['name'], copy=False)
+    return array
+
+
+def _artifact_directory(snapshot_path):
+    return f'{os.path.splitext(snapshot_path)[0]}.artifact'
+
+
+def feature_names(model_data):
+    """Columns the model was fitted on, in fit order, or None when it was fitted on a bare array."""
+    model = model_data.get('model')
+    if hasattr(model, 'feature_names_in_'):
+        return [str(name) for name in model.feature_names_in_]
+    columns = getattr(model_data.get('X_test'), 'columns', None)
+    if columns is not None:
+        return [str(name) for name in columns]
+    return None
+
+
+def feature_columns(model_data, columns):
+    """Names for the model's features: the stored ones, else the non-feature-filtered `columns` of
+    features_model.parquet when their count matches, else positional names.
+    """
+    if model_data.get('feature_names') is not None:
+        return model_data['feature_names']
+    n_features = getattr(model_data['model'], 'n_features_in_', None)
+    candidates = [str(column) for column in columns if column not in NON_FEATURE_COLUMNS]
+    if n_features is None or len(candidates) == n_features:
+        return candidates
+    return [f'feature_{i}' for i in range(n_features)]
+
+
+def unpack_model_data(snapshot_path, directory):
+    """Splits a model_data pickle into small pickled objects plus one .npy file per large array."""
+    with open(snapshot_path, 'rb') as file:
+        model_data = pickle.load(file)
+
+    tmp_directory = f'{directory}.{os.getpid()}.{threading.get_ident()}.tmp'
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    arrays = {}
+    objects = {}
+    for key, value in model_data.items():
+        if key in ARRAY_KEYS:
+            array, meta = _to_array(value)
+            # Object arrays cannot be memory-mapped; keep them pickled.
+            if array.dtype != object:
+                np.save(os.path.join(tmp_directory, f'{key}.npy'), array)
+                arrays[key] = meta
+                continue
+        objects[key] = value
+    objects['feature_names'] = feature_names(model_data)
+    with open(os.path.join(tmp_directory, 'objects.pkl'), 'wb') as file:
+        pickle.dump(objects, file, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(tmp_directory, 'arrays.json'), 'w') as file:
+        json.dump(arrays, file)
+
+    try:
+        os.rename(tmp_directory, directory)
+    except OSError:
+        # Another process or thread finished unpacking the same version first.
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+
+
+def load_model_data(snapshot_path):
+    """Loads a model_data pickle snapshot with X_test/y_test/y_pred memory-mapped from disk.
+
+    The unpacked directory is keyed by the snapshot's content-addressed path, so every worker
+    process maps the same files and the OS page cache holds a single physical copy.
+    """
+    directory = _artifact_directory(snapshot_path)
+    if not os.path.isdir(directory):
+        unpack_model_data(snapshot_path, directory)
+
+    with open(os.path.join(directory, 'objects.pkl'), 'rb') as file:
+        model_data = pickle.load(file)
+    with open(os.path.join(directory, 'arrays.json')) as file:
+        arrays = json.load(file)
+    for key, meta in arrays.items():
+        array = np.load(os.path.join(directory, f'{key}.npy'), mmap_mode='r')
+        model_data[key] = _from_array(array, meta)
+    if 'feature_names' not in model_data:
+        # Unpacked before feature names were stored with the artifact.
+        model_data['feature_names'] = feature_names(model_data)
+    return model_data
+
+
+def evaluate_model(model_data):
+    """Probabilities, ROC/PR curves, AUC and weighted metrics for the pickled test split."""
+    y_test = np.asarray(model_data['y_test'])
+    y_pred = np.asarray(model_data['y_pred'])
+    y_proba = model_data['model'].predict_proba(model_data['X_test'])[:, 1]
+    fpr, tpr, roc_thresholds = roc_curve(y_test, y_proba)
+    precision, recall, pr_thresholds = precision_recall_curve(y_test, y_proba)
+    # Sorted scores and running positive counts turn any threshold into a searchsorted lookup.
+    order = np.argsort(y_proba, kind='stable')
+    positives = y_test[order] == model_data['model'].classes_[1]
+    return {
+        'y_proba': y_proba,
+        'fpr': fpr,
+        'tpr': tpr,
+        'roc_thresholds': roc_thresholds,
+        'roc_auc': auc(fpr, tpr),
+        'precision': precision,
+        'recall': recall,
+        'pr_thresholds': pr_thresholds,
+        'accuracy_score': accuracy_score(y_test, y_pred) * 100,
+        'f1_score': f1_score(y_test, y_pred, average='weighted') * 100,
+        'recall_score': recall_score(y_test, y_pred, average='weighted') * 100,
+        'sorted_scores': y_proba[order],
+        'cumulative_positives': np.concatenate([[0], np.cumsum(positives)]),
+    }
+
+
+def threshold_metrics(evaluation, threshold):
+    """Confusion matrix, precision, recall and F1 on the test split when clients with a churn
+    probability >= threshold are flagged.
+    """
+    scores = evaluation['sorted_scores']
+    cumulative_positives = evaluation['cumulative_positives']
+    below = int(np.searchsorted(scores, threshold, side='left'))
+    fn = int(cumulative_positives[below])
+    tp = int(cumulative_positives[-1]) - fn
+    tn = below - fn
+    fp = len(scores) - below - tp
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'tp': tp, 'fp': fp, 'tn': tn, 'fn': fn, 'flagged': tp + fp,
+            'precision': precision, 'recall': recall, 'f1': f1}
+
+
+def load_evaluation(snapshot_path):
+    """Evaluation bundle for a model_data snapshot, computed once per model version.
+
+    The bundle is stored next to the unpacked artifact, so later processes only read it back.
+    """
+    path = os.path.join(_artifact_directory(snapshot_path), f'evaluation-v{EVALUATION_VERSION}.npz')
+    if not os.path.exists(path):
+        evaluation = evaluate_model(load_model_data(snapshot_path))
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz'
+        np.savez(tmp_path, **evaluation)
+        os.replace(tmp_path, path)
+    with np.load(path) as stored:
+        return {key: stored[key] if stored[key].ndim else stored[key].item() for key in stored.files}
+
+
+def permutation_key(model_version):
+    """Bucket key of the permutation importance of one version of model_data.pkl."""
+    return f'permutation_importance/{model_version}.npz'
+
+
+def compute_permutation_importance(snapshot_path, output_path, n_jobs=-1):
+    """Writes the mean and std of the score drop when each feature of the test split is shuffled.
+
+    Uses every core by default, so run it offline (scoring.py does), never in the dashboard.
+    """
+    model_data = load_model_data(snapshot_path)
+    X_test = model_data['X_test']
+    result = permutation_importance(model_data['model'], X_test, np.asarray(model_data['y_test']),
+                                    n_repeats=PERMUTATION_REPEATS, n_jobs=n_jobs, random_state=0,
+                                    max_samples=min(1.0, PERMUTATION_MAX_SAMPLES / max(len(X_test), 1)))
+    with open(output_path, 'wb') as file:
+        np.savez(file, importances_mean=result.importances_mean, importances_std=result.importances_std)
+
+
+def load_permutation_importance(snapshot_path):
+    """Loads a permutation importance snapshot written by compute_permutation_importance."""
+    with np.load(snapshot_path) as stored:
+        return pd.DataFrame({'Importance': stored['importances_mean'], 'Std': stored['importances_std']})
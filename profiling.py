@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import data_access
+
+
+# One file per process ({pid} is replaced), so several server processes never overwrite each other.
+METRICS_PATH = os.environ.get('TCA_METRICS_PATH', '/tmp/tca_metrics-{pid}.prom')
+METRICS_EXPORT_SECONDS = 15
+# Durations kept per (page, stage) for the exported quantiles.
+METRICS_WINDOW = 1000
+METRICS_QUANTILES = (0.5, 0.95)
+# Comma-separated usernames allowed to see the profiler panel.
+ADMIN_USERS = {user.strip() for user in os.environ.get('TCA_ADMIN_USERS', '').split(',') if user.strip()}
+MAX_RECORDS = 500
+
+_metrics_lock = threading.Lock()
+# Process-wide per-(page, stage) aggregates across every session, exported to METRICS_PATH.
+_stage_metrics = {}
+_process_rss = None
+_exporter = None
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def begin_rerun():
+    """Starts a new rerun id for the spans recorded by this session."""
+    st.session_state['profiler_rerun_id'] = uuid.uuid4().hex[:12]
+
+
+def begin_fragment_rerun():
+    """Starts a new rerun id when only a fragment is rerunning; a full rerun keeps main's id."""
+    ctx = get_script_run_ctx()
+    if ctx is not None and ctx.fragment_ids_this_run:
+        begin_rerun()
+
+
+def _rerun_id():
+    if 'profiler_rerun_id' not in st.session_state:
+        begin_rerun()
+    return st.session_state['profiler_rerun_id']
+
+
+def _metric_lines():
+    lines = [
+        '# HELP tca_stage_duration_seconds Wall time of one dashboard stage per rerun.',
+        '# TYPE tca_stage_duration_seconds summary',
+    ]
+    pid = os.getpid()
+    for (page, stage), metric in sorted(_stage_metrics.items()):
+        labels = f'pid="{pid}",page="{page}",stage="{stage}"'
+        durations = sorted(metric['window'])
+        for quantile in METRICS_QUANTILES:
+            value = durations[min(int(quantile * len(durations)), len(durations) - 1)]
+            lines.append(f'tca_stage_duration_seconds{{{labels},quantile="{quantile}"}} {value:.6f}')
+        lines.append(f'tca_stage_duration_seconds_sum{{{labels}}} {metric["seconds"]:.6f}')
+        lines.append(f'tca_stage_duration_seconds_count{{{labels}}} {metric["count"]}')
+    lines += [
+        # Can go down, so a gauge rather than a counter.
+        '# HELP tca_stage_rss_delta_bytes_sum Sum of the process RSS change over each dashboard stage.',
+        '# TYPE tca_stage_rss_delta_bytes_sum gauge',
+    ]
+    for (page, stage), metric in sorted(_stage_metrics.items()):
+        lines.append(f'tca_stage_rss_delta_bytes_sum{{pid="{pid}",page="{page}",stage="{stage}"}} '
+                     f'{metric["rss_delta_bytes"]}')
+    if _process_rss is not None:
+        lines += [
+            '# HELP tca_process_rss_bytes Resident memory of the dashboard process.',
+            '# TYPE tca_process_rss_bytes gauge',
+            f'tca_process_rss_bytes{{pid="{pid}"}} {_process_rss}',
+        ]
+    return lines
+
+
+def _write_metrics():
+    """Rewrites this process's METRICS_PATH from the aggregates.
+
+    The file is a complete Prometheus text exposition (no client timestamps), replaced
+    atomically so a textfile collector never reads it half-written.
+    """
+    path = METRICS_PATH.format(pid=os.getpid())
+    with _metrics_lock:
+        text = '\n'.join(_metric_lines()) + '\n'
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def _export_forever():
+    while True:
+        time.sleep(METRICS_EXPORT_SECONDS)
+        _write_metrics()
+
+
+def _start_exporter():
+    global _exporter
+    with _metrics_lock:
+        if _exporter is None:
+            _exporter = threading.Thread(target=_export_forever, name='tca-metrics-export', daemon=True)
+            _exporter.start()
+
+
+def _export(record):
+    """Adds the span to the process-wide aggregates; a background thread writes them out every
+    METRICS_EXPORT_SECONDS, so no rerun waits on the file.
+    """
+    global _process_rss
+    _start_exporter()
+    with _metrics_lock:
+        metric = _stage_metrics.setdefault((record['page'], record['stage']), {
+            'count': 0, 'seconds': 0.0, 'rss_delta_bytes': 0, 'window': deque(maxlen=METRICS_WINDOW)})
+        metric['count'] += 1
+        metric['seconds'] += record['seconds']
+        metric['window'].append(record['seconds'])
+        if record['rss_delta_bytes'] is not None:
+            metric['rss_delta_bytes'] += record['rss_delta_bytes']
+            _process_rss = record['rss_bytes']
+
+
+def record_span(page, stage, seconds, rss_before, widgets):
+    rss_after = _rss_bytes()
+    record = {
+        'rerun_id': _rerun_id(),
+        'page': page,
+        'stage': stage,
+        'seconds': seconds,
+        'rss_bytes': rss_after,
+        'rss_delta_bytes': None if rss_before is None or rss_after is None else rss_after - rss_before,
+        'widgets': dict(widgets),
+        'timestamp': time.time(),
+    }
+    records = st.session_state.setdefault('profiler_records', [])
+    records.append(record)
+    del records[:-MAX_RECORDS]
+    _export(record)
+
+
+@contextmanager
+def span(page, stage, **widgets):
+    """Times one block and records its wall time and RSS change."""
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(page, stage, time.perf_counter() - start, rss_before, widgets)
+
+
+class PageProfiler:
+    """Sequential spans for a page script: each stage() call closes the previous stage.
+
+    Widget values set on `widgets` are attached to every span recorded after they are known.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.widgets = {}
+        self._stage = None
+
+    def stage(self, name):
+        self.finish()
+        self._stage = (name, time.perf_counter(), _rss_bytes())
+
+    def finish(self):
+        if self._stage is not None:
+            name, start, rss_before = self._stage
+            record_span(self.page, name, time.perf_counter() - start, rss_before, self.widgets)
+            self._stage = None
+
+
+def render_profiler_panel(username):
+    if username not in ADMIN_USERS:
+        return
+    records = st.session_state.get('profiler_records', [])
+    with st.sidebar.expander('Profiler'):
+        if not records:
+            st.caption('Sin mediciones todavía.')
+            return
+        rerun_id = records[-1]['rerun_id']
+        latest = pd.DataFrame([r for r in records if r['rerun_id'] == rerun_id])
+        st.caption(f'Rerun {rerun_id} · {latest["seconds"].sum():.3f}s')
+        st.dataframe(pd.DataFrame({
+            'Página': latest['page'],
+            'Etapa': latest['stage'],
+            'ms': (latest['seconds'] * 1000).round(1),
+            'Δ RSS MB': latest['rss_delta_bytes'].astype('float64') / 2**20,
+        }), hide_index=True, use_container_width=True)
+        st.json(latest['widgets'].iloc[-1], expanded=False)
+        if data_access.memory_reports:
+            st.caption('Memoria de datasets')
+            st.dataframe(pd.DataFrame([
+                {'Dataset': file_name, 'Antes MB': report['before_bytes'] / 2**20,
+                 'Después MB': report['after_bytes'] / 2**20, 'Ahorro MB': report['saved_bytes'] / 2**20}
+                for (_, file_name, _), report in data_access.memory_reports.items()
+            ]).round(1), hide_index=True, use_container_width=True)
+        history = pd.DataFrame(records).groupby(['page', 'stage'])['seconds'].describe(percentiles=[0.5, 0.95])
+        st.dataframe(history[['count', 'mean', '50%', '95%', 'max']].round(4), use_container_width=True)
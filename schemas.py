@@ -0,0 +1,54 @@
+import pandas as pd
+from pandas.api import types
+
+
+# Columns whose compact dtype is known per dataset; other columns fall back to the generic rules.
+DATASET_SCHEMAS = {
+    'reservaciones_dashboard.parquet': {
+        'category': ['empresa', 'canal', 'tipo_habitacion', 'paquete', 'pais', 'agencia', 'segmento',
+                     'estatus_reservacion'],
+        'integer': ['reservacion', 'num_noches'],
+    },
+    'features_dashboard.parquet': {
+        'category': ['empresa'],
+    },
+    'features_model.parquet': {
+        'boolean': ['churn'],
+    },
+}
+# Object columns with at most this share of distinct values become categoricals.
+CATEGORY_MAX_RATIO = 0.5
+
+
+def _compact(series, schema):
+    name = series.name
+    if name in schema.get('category', ()):
+        return series.astype('category')
+    if name in schema.get('boolean', ()) and not series.isna().any():
+        return series.astype(bool)
+    if types.is_bool_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    if types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast='integer')
+    if name in schema.get('integer', ()) and types.is_float_dtype(series):
+        values = series.to_numpy()
+        if not series.isna().any() and (values == values.round()).all():
+            return pd.to_numeric(series, downcast='integer')
+        return series
+    if types.is_object_dtype(series) and len(series):
+        if series.nunique(dropna=True) <= CATEGORY_MAX_RATIO * len(series):
+            return series.astype('category')
+    return series
+
+
+def optimize_dtypes(data, schema=None):
+    """Converts low-cardinality strings to categoricals and downcasts integers and flags.
+
+    Returns the compacted frame and a report with the memory before and after, in bytes.
+    Float columns are left as float64 so revenue sums keep their precision.
+    """
+    schema = schema or {}
+    before = int(data.memory_usage(deep=True).sum())
+    data = pd.DataFrame({column: _compact(data[column], schema) for column in data.columns}, index=data.index)
+    after = int(data.memory_usage(deep=True).sum())
+    return data, {'before_bytes': before, 'after_bytes': after, 'saved_bytes': before - after}
@@ -0,0 +1,107 @@
+"""Batch churn scoring of every client in features_model.parquet.
+
+    python scoring.py
+    python scoring.py --bucket tcadata --chunk-rows 100000 --workers 8
+
+Streams the feature parquet in record batches, scores them with the model in model_data.pkl across
+a process pool and uploads churn_scores.parquet (client_key, churn_probability) to the bucket,
+where the model page reads its at-risk clients from. Only a few chunks per worker are held in
+memory at a time, whatever the number of clients. The model's permutation importance is
+precomputed too and uploaded under permutation_importance/<model version>.npz.
+"""
+import argparse
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_access import enable_copy_on_write, fetch_object, get_backend
+from model_artifacts import compute_permutation_importance, feature_columns, load_model_data, permutation_key
+
+
+FEATURES_KEY = 'features_model.parquet'
+MODEL_KEY = 'model_data.pkl'
+SCORES_KEY = 'churn_scores.parquet'
+CHUNK_ROWS = 100_000
+# Chunks queued per worker; bounds how many decoded chunks exist at once.
+CHUNKS_PER_WORKER = 2
+
+SCORES_SCHEMA = pa.schema([('client_key', pa.int64()), ('churn_probability', pa.float32())])
+
+_model = None
+
+
+def _init_worker(model_path):
+    global _model
+    _model = load_model_data(model_path)['model']
+
+
+def _score(chunk):
+    client_key, features = chunk
+    probability = _model.predict_proba(features)[:, 1].astype(np.float32)
+    return pa.table({'client_key': pa.array(client_key, pa.int64()),
+                     'churn_probability': pa.array(probability, pa.float32())}, schema=SCORES_SCHEMA)
+
+
+def _chunks(features_path, columns, chunk_rows):
+    parquet_file = pq.ParquetFile(features_path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=['client_key'] + columns):
+        frame = batch.to_pandas()
+        yield frame['client_key'].to_numpy(), frame[columns]
+
+
+def score_clients(features_path, model_path, output_path, chunk_rows=CHUNK_ROWS, workers=None):
+    """Writes churn probabilities for every row of the features parquet; returns the row count."""
+    # Unpacks the artifact once here so the workers only memory-map it.
+    model_data = load_model_data(model_path)
+    columns = feature_columns(model_data, pq.ParquetFile(features_path).schema_arrow.names)
+    del model_data
+    workers = workers or os.cpu_count() or 1
+    rows = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as pool, \
+            pq.ParquetWriter(output_path, SCORES_SCHEMA) as writer:
+        pending = []
+        for chunk in _chunks(features_path, columns, chunk_rows):
+            pending.append(pool.submit(_score, chunk))
+            del chunk
+            # Results are written in input order while later chunks are still being scored.
+            while len(pending) >= workers * CHUNKS_PER_WORKER or (pending and pending[0].done()):
+                table = pending.pop(0).result()
+                writer.write_table(table)
+                rows += table.num_rows
+        for future in pending:
+            table = future.result()
+            writer.write_table(table)
+            rows += table.num_rows
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bucket', default='tcadata')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--workers', type=int, help='Scoring processes (default: one per CPU).')
+    args = parser.parse_args(argv)
+    enable_copy_on_write()
+
+    backend = get_backend(args.bucket)
+    features_path = fetch_object(args.bucket, FEATURES_KEY)
+    model_version = backend.version(MODEL_KEY)
+    model_path = fetch_object(args.bucket, MODEL_KEY, model_version)
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, SCORES_KEY)
+        rows = score_clients(features_path, model_path, output_path, args.chunk_rows, args.workers)
+        backend.upload(output_path, SCORES_KEY)
+        # Keyed by the model version it was computed for, so the model page never pairs it with another model.
+        importance_path = os.path.join(tmp, 'permutation_importance.npz')
+        compute_permutation_importance(model_path, importance_path)
+        backend.upload(importance_path, permutation_key(model_version))
+    print(f'Scored {rows} clients into {args.bucket}/{SCORES_KEY}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
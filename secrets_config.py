@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import boto3
+import yaml
+from yaml.loader import SafeLoader
+
+
+SECRET_NAME = os.environ.get('TCA_SECRET_NAME', 'your-secret-name')  # Replace with your secret name
+SECRET_REGION = os.environ.get('TCA_SECRET_REGION', 'your-aws-region')  # Replace with your AWS region
+# Set TCA_SECRET_FILE to a JSON file shaped like the secret ({"config.yaml": "..."}) to run without AWS.
+SECRET_FILE = os.environ.get('TCA_SECRET_FILE')
+SECRET_TTL_SECONDS = int(os.environ.get('TCA_SECRET_TTL_SECONDS', 900))
+
+logger = logging.getLogger(__name__)
+
+
+class SecretsManagerBackend:
+    def __init__(self, secret_name, region_name):
+        self.secret_name = secret_name
+        self.client = boto3.client(service_name='secretsmanager', region_name=region_name)
+
+    def read(self):
+        """Returns (version, secret string)."""
+        response = self.client.get_secret_value(SecretId=self.secret_name)
+        return response['VersionId'], response['SecretString']
+
+
+class FileSecretBackend:
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        stat = os.stat(self.path)
+        with open(self.path) as file:
+            return f'{stat.st_mtime_ns}-{stat.st_size}', file.read()
+
+
+def get_secret_backend():
+    if SECRET_FILE:
+        return FileSecretBackend(SECRET_FILE)
+    return SecretsManagerBackend(SECRET_NAME, SECRET_REGION)
+
+
+_lock = threading.Lock()
+_backend = None
+# (loaded_at, version, parsed config) of the last successful read.
+_entry = None
+_refreshing = False
+
+
+def _load():
+    global _backend, _entry
+    if _backend is None:
+        _backend = get_secret_backend()
+    version, secret = _backend.read()
+    if _entry is not None and _entry[1] == version:
+        config = _entry[2]
+    else:
+        config = yaml.load(json.loads(secret)['config.yaml'], Loader=SafeLoader)
+        if _entry is not None:
+            logger.info('Secret %s rotated to version %s', SECRET_NAME, version)
+    _entry = (time.monotonic(), version, config)
+    return config
+
+
+def _refresh():
+    global _refreshing
+    try:
+        with _lock:
+            _load()
+    except Exception:
+        logger.exception('Refreshing the secret failed; keeping the previous configuration')
+    finally:
+        _refreshing = False
+
+
+def get_config():
+    """The parsed config.yaml from the secret, shared by every session in the process.
+
+    The first call reads the secret; later calls return the cached config and, once it is older
+    than SECRET_TTL_SECONDS, re-read the secret in the background so a rotation is picked up
+    without any rerun waiting on Secrets Manager. Returns None if the secret cannot be read.
+    Treat the returned dict as read-only.
+    """
+    global _refreshing
+    entry = _entry
+    if entry is None:
+        try:
+            with _lock:
+                return _entry[2] if _entry is not None else _load()
+        except Exception as e:
+            logger.error('Error retrieving secret: %s', e)
+            return None
+    if time.monotonic() - entry[0] > SECRET_TTL_SECONDS and not _refreshing:
+        _refreshing = True
+        threading.Thread(target=_refresh, name='tca-secret-refresh', daemon=True).start()
+    return entry[2]
@@ -0,0 +1,20 @@
+import weakref
+
+import streamlit as st
+
+
+# st.fragment is still experimental in the pinned Streamlit release.
+fragment = getattr(st, 'fragment', None) or st.experimental_fragment
+
+
+def memoize_section(name, source, inputs, compute):
+    """Returns compute(), reusing this session's last result for the section while the source
+    dataset is the same object and `inputs` (the only values the section reads) are unchanged.
+    """
+    store = st.session_state.setdefault('section_memo', {})
+    entry = store.get(name)
+    if entry is not None and entry[0]() is source and entry[1] == inputs:
+        return entry[2]
+    value = compute()
+    store[name] = (weakref.ref(source), inputs, value)
+    return value
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_access
+
+
+@pytest.fixture(autouse=True)
+def copy_on_write():
+    data_access.enable_copy_on_write()
+    yield
+
+
+@pytest.fixture
+def local_bucket(tmp_path, monkeypatch):
+    """An empty local bucket directory with the data layer pointed at it and an empty cache."""
+    monkeypatch.setattr(data_access, 'DATA_DIR', str(tmp_path / 'data'))
+    monkeypatch.setattr(data_access, 'SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    # Tests drive refresh_stale() themselves.
+    monkeypatch.setattr(data_access, '_start_refresher', lambda: None)
+    data_access.clear_cache()
+    bucket = tmp_path / 'data' / 'tcadata'
+    bucket.mkdir(parents=True)
+    yield bucket
+    data_access.clear_cache()
+
+
+@pytest.fixture
+def write_parquet():
+    """Writes a frame and bumps the file's mtime, so the local backend always sees a new version."""
+    def write(path, frame):
+        frame.to_parquet(path)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    return write
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({'a': [3, 1, 2], 'b': [1.0, None, 3.0]})
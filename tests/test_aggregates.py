@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import (CUBE_DIMENSIONS, add_calendar_index, build_revenue_cube, monthly_revenue, period_slice,
+                        reservations_by_status, revenue_by, revenue_totals)
+
+
+# (year, month) filters of the home page; None is 'Todos'.
+PERIODS = [(None, None), (2020, None), (2020, 3)]
+
+
+@pytest.fixture(scope='module')
+def reservations():
+    rng = np.random.default_rng(0)
+    n = 5_000
+    data = pd.DataFrame({
+        'empresa': pd.Categorical(rng.choice(['HOTEL 1', 'HOTEL 2'], n)),
+        'fecha_reservacion': pd.Timestamp('2019-01-01') + pd.to_timedelta(rng.integers(0, 730 * 24, n), unit='h'),
+        'reservacion': rng.integers(0, 2, n),
+        'tfa_total': np.round(rng.gamma(2, 500, n), 2),
+    })
+    for dimension in CUBE_DIMENSIONS:
+        data[dimension] = pd.Categorical(rng.choice([f'{dimension} {i}' for i in range(8)], n))
+    return add_calendar_index(data)
+
+
+def baseline_rows(data, year, month):
+    """The rows the original page filtered with boolean masks."""
+    rows = data[data['empresa'] == 'HOTEL 1']
+    if year is not None:
+        rows = rows[rows['fecha_reservacion'].dt.year == year]
+    if month is not None:
+        rows = rows[rows['fecha_reservacion'].dt.month == month]
+    return rows
+
+
+@pytest.mark.parametrize('year, month', PERIODS)
+def test_cube_matches_baseline_groupbys(reservations, year, month):
+    cube = build_revenue_cube(reservations)
+    rows = baseline_rows(reservations, year, month)
+    reserved = rows[rows['reservacion'] == 1]
+
+    cancelaciones, reservaciones, tarifa_total = revenue_totals(cube, 'HOTEL 1', year, month)
+    assert cancelaciones == (rows['reservacion'] == 0).sum()
+    assert reservaciones == len(reserved)
+    assert tarifa_total == pytest.approx(rows['tfa_total'].sum())
+
+    expected = reserved.groupby(reserved['fecha_reservacion'].dt.to_period('M').astype(str))['tfa_total'].sum()
+    monthly = monthly_revenue(cube, 'HOTEL 1', year, month)
+    assert monthly['Date'].tolist() == expected.index.tolist()
+    assert monthly['Total_TFA'].tolist() == pytest.approx(expected.tolist())
+
+    for dimension in CUBE_DIMENSIONS:
+        expected = reserved.groupby(dimension, observed=True)['tfa_total'].sum()
+        revenue = revenue_by(cube, dimension, 'HOTEL 1', year, month)
+        assert dict(zip(revenue[dimension], revenue['tfa_total'])) == pytest.approx(
+            {str(label): value for label, value in expected.items()})
+
+    expected = reserved['estatus_reservacion'].value_counts()
+    expected = expected[expected > 0]
+    status = reservations_by_status(cube, 'HOTEL 1', year, month)
+    assert dict(zip(status['estatus_reservacion'], status['num_reservations'])) == {
+        str(label): count for label, count in expected.items()}
+    assert status['num_reservations'].is_monotonic_decreasing
+
+
+def test_period_slice_matches_masks(reservations):
+    for year, month in PERIODS:
+        expected = reservations
+        if year is not None:
+            expected = expected[expected['fecha_reservacion'].dt.year == year]
+        if month is not None:
+            expected = expected[expected['fecha_reservacion'].dt.month == month]
+        pd.testing.assert_frame_equal(period_slice(reservations, year, month), expected)
+
+
+def test_add_calendar_index_drops_rows_without_date():
+    data = pd.DataFrame({
+        'fecha_reservacion': pd.to_datetime(['2020-03-05', None, '2019-12-31']),
+        'tfa_total': [1.0, 2.0, 3.0],
+    })
+    indexed = add_calendar_index(data)
+    assert indexed['tfa_total'].tolist() == [3.0, 1.0]
+    assert indexed['year'].tolist() == [2019, 2020]
+    assert indexed['month'].tolist() == [12, 3]
+    assert period_slice(indexed, 2020, 3)['tfa_total'].tolist() == [1.0]
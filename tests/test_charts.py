@@ -0,0 +1,12 @@
+import pytest
+
+from charts import vega_bin_extent
+
+
+@pytest.mark.parametrize('values, maxbins, expected', [
+    ([0, 37.5, 100], 10, (0, 100, 10)),
+    ([1, 7, 19], 50, (1, 19, 0.5)),
+    ([], 10, (0, 1, 1)),
+])
+def test_vega_bin_extent_matches_vega_lite(values, maxbins, expected):
+    assert vega_bin_extent(values, maxbins) == pytest.approx(expected)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from churn import CHURN_WINDOWS, ChurnEngine, churn_curves
+
+
+@pytest.fixture(scope='module')
+def last_reservations():
+    rng = np.random.default_rng(0)
+    return pd.Series(pd.Timestamp('2019-01-01') + pd.to_timedelta(rng.integers(0, 730 * 24, 3_000), unit='h'))
+
+
+def baseline_rate(last_reservations, reference_date, window_days):
+    """The original page's churn rate: days since the last reservation over the window."""
+    days = (pd.to_datetime(reference_date) - last_reservations).dt.days
+    return (days > window_days).sum() / len(last_reservations) * 100
+
+
+@pytest.mark.parametrize('reference_date', ['2019-06-15', '2020-04-30', '2021-03-01'])
+@pytest.mark.parametrize('window_days', CHURN_WINDOWS.values())
+def test_rate_matches_baseline(last_reservations, reference_date, window_days):
+    engine = ChurnEngine(last_reservations)
+    assert engine.rate(reference_date, window_days) == pytest.approx(
+        baseline_rate(last_reservations, reference_date, window_days))
+
+
+def test_curves_match_baseline(last_reservations):
+    engine = ChurnEngine(last_reservations)
+    curves = churn_curves(engine, '2020-01-01', '2020-01-31')
+    for row in curves.sample(40, random_state=0).itertuples():
+        assert row.Churn == pytest.approx(baseline_rate(last_reservations, row.Fecha, CHURN_WINDOWS[row.Periodo]))
+
+
+def test_empty_engine_has_no_rate():
+    assert np.isnan(ChurnEngine([]).rate('2020-01-01', 30))
@@ -0,0 +1,137 @@
+import os
+
+import pandas as pd
+import pytest
+
+import data_access
+from data_access import ReadOnlyFrame
+
+
+WRITES = {
+    'setitem': lambda df: df.__setitem__('c', 1),
+    'delitem': lambda df: df.__delitem__('a'),
+    'insert': lambda df: df.insert(0, 'c', 1),
+    'pop': lambda df: df.pop('a'),
+    'loc': lambda df: df.loc.__setitem__((0, 'a'), 5),
+    'iloc': lambda df: df.iloc.__setitem__((0, 0), 5),
+    'at': lambda df: df.at.__setitem__((0, 'a'), 5),
+    'drop_inplace': lambda df: df.drop(columns='b', inplace=True),
+    'sort_inplace': lambda df: df.sort_values('a', inplace=True),
+    'rename_inplace': lambda df: df.rename(columns={'a': 'z'}, inplace=True),
+    'fillna_inplace': lambda df: df.fillna(0, inplace=True),
+    'set_index_inplace': lambda df: df.set_index('a', inplace=True),
+    'reset_index_inplace': lambda df: df.reset_index(drop=True, inplace=True),
+    'iadd': lambda df: df.__iadd__(1),
+    'index': lambda df: setattr(df, 'index', [7, 8, 9]),
+    'columns': lambda df: setattr(df, 'columns', ['x', 'y']),
+}
+
+
+@pytest.mark.parametrize('write', WRITES.values(), ids=WRITES.keys())
+def test_read_only_frame_rejects_writes(frame, write):
+    shared = ReadOnlyFrame(frame)
+    expected = frame.copy()
+    with pytest.raises(TypeError):
+        write(shared)
+    pd.testing.assert_frame_equal(pd.DataFrame(shared), expected)
+
+
+def test_read_only_frame_derives_writable_frames(frame):
+    shared = ReadOnlyFrame(frame)
+    derived = shared[shared['a'] > 1]
+    derived['c'] = 1
+    derived.loc[derived.index[0], 'a'] = 10
+    assert type(derived) is pd.DataFrame
+    assert type(shared.sort_values('a')) is pd.DataFrame
+    assert 'c' not in shared.columns
+    assert shared['a'].tolist() == [3, 1, 2]
+
+
+def test_missing_object_is_cached_until_it_appears(local_bucket, write_parquet, frame, monkeypatch):
+    versions = []
+    backend = data_access.get_backend('tcadata')
+    original = backend.version
+    monkeypatch.setattr(backend, 'version', lambda key: versions.append(key) or original(key))
+
+    assert data_access.get_dataset('tcadata', 'scores.parquet', missing_ok=True) is None
+    assert data_access.get_dataset('tcadata', 'scores.parquet', missing_ok=True) is None
+    assert versions == ['scores.parquet']
+    with pytest.raises(data_access.MissingObject):
+        data_access.get_dataset('tcadata', 'scores.parquet')
+
+    write_parquet(local_bucket / 'scores.parquet', frame)
+    assert data_access.refresh_stale() == 1
+    assert data_access.get_dataset('tcadata', 'scores.parquet', missing_ok=True)['a'].tolist() == [3, 1, 2]
+
+
+def test_stale_entry_is_swapped_in_by_the_refresher(local_bucket, write_parquet, frame):
+    write_parquet(local_bucket / 'data.parquet', frame)
+    old = data_access.get_dataset('tcadata', 'data.parquet')
+    assert data_access.refresh_stale() == 0
+
+    write_parquet(local_bucket / 'data.parquet', frame.assign(a=[7, 8, 9]))
+    # Reads never wait on a refresh: the previous version is served until the swap.
+    assert data_access.get_dataset('tcadata', 'data.parquet') is old
+    assert data_access.refresh_stale() == 1
+    assert data_access.get_dataset('tcadata', 'data.parquet')['a'].tolist() == [7, 8, 9]
+    assert old['a'].tolist() == [3, 1, 2]
+
+
+def column_total(data):
+    column_total.calls += 1
+    return data['a'].sum()
+
+
+def test_derived_values_are_rebuilt_before_the_swap(local_bucket, write_parquet, frame, monkeypatch):
+    column_total.calls = 0
+    write_parquet(local_bucket / 'data.parquet', frame)
+    old = data_access.get_dataset('tcadata', 'data.parquet')
+    assert data_access.get_derived(old, 'column_total', column_total) == 6
+
+    swapped = []
+    store = data_access._store
+    monkeypatch.setattr(data_access, '_store', lambda cache_key, entry: swapped.append(
+        [name for name, _ in data_access._derived_builders(entry.value)]) or store(cache_key, entry))
+    write_parquet(local_bucket / 'data.parquet', frame.assign(a=[7, 8, 9]))
+    assert data_access.refresh_stale() == 1
+    assert swapped == [['column_total']]
+    assert column_total.calls == 2
+
+    new = data_access.get_dataset('tcadata', 'data.parquet')
+    assert data_access.get_derived(new, 'column_total', column_total) == 24
+    assert column_total.calls == 2
+
+
+def unpack(path):
+    """Stands in for load_model_data: unpacks next to the snapshot, sharing its name stem."""
+    directory = f'{os.path.splitext(path)[0]}.artifact'
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def test_superseded_snapshot_is_removed_once_unused(local_bucket, write_parquet, frame, monkeypatch):
+    backend = data_access.get_backend('tcadata')
+    write_parquet(local_bucket / 'model.parquet', frame)
+    old_version = backend.version('model.parquet')
+    old_snapshot = data_access.snapshot_path('tcadata', 'model.parquet', old_version)
+    old_artifact = data_access.get_artifact('tcadata', 'model.parquet', unpack)
+    data_access.get_dataset('tcadata', 'model.parquet')
+    assert os.path.exists(old_snapshot) and os.path.isdir(old_artifact)
+
+    write_parquet(local_bucket / 'model.parquet', frame.assign(a=[7, 8, 9]))
+    read_parquet = data_access.read_parquet
+
+    def failing_read(path, columns=None):
+        raise OSError('unreadable')
+
+    # The dataset keeps serving the old version, so its snapshot must stay.
+    monkeypatch.setattr(data_access, 'read_parquet', failing_read)
+    assert data_access.refresh_stale() == 1
+    assert data_access.get_artifact('tcadata', 'model.parquet', unpack) != old_artifact
+    assert os.path.exists(old_snapshot) and os.path.isdir(old_artifact)
+
+    monkeypatch.setattr(data_access, 'read_parquet', read_parquet)
+    assert data_access.refresh_stale() == 1
+    assert not os.path.exists(old_snapshot) and not os.path.exists(old_artifact)
+    new_snapshot = data_access.snapshot_path('tcadata', 'model.parquet', backend.version('model.parquet'))
+    assert os.path.exists(new_snapshot)
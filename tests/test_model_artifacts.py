@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import confusion_matrix, f1_score, precision_score, recall_score
+
+from model_artifacts import evaluate_model, threshold_metrics
+
+
+@pytest.fixture(scope='module')
+def model_data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 3))
+    y = X[:, 0] + rng.normal(size=500) > 0
+    model = LogisticRegression().fit(X, y)
+    return {'model': model, 'X_test': X, 'y_test': y, 'y_pred': model.predict(X)}
+
+
+@pytest.mark.parametrize('threshold', [0.0, 0.25, 0.5, 0.8, 1.0])
+def test_threshold_metrics_match_sklearn(model_data, threshold):
+    evaluation = evaluate_model(model_data)
+    flagged = evaluation['y_proba'] >= threshold
+    y_test = model_data['y_test']
+    tn, fp, fn, tp = confusion_matrix(y_test, flagged, labels=[False, True]).ravel()
+
+    metrics = threshold_metrics(evaluation, threshold)
+    assert (metrics['tp'], metrics['fp'], metrics['tn'], metrics['fn']) == (tp, fp, tn, fn)
+    assert metrics['flagged'] == flagged.sum()
+    assert metrics['precision'] == pytest.approx(precision_score(y_test, flagged, zero_division=0))
+    assert metrics['recall'] == pytest.approx(recall_score(y_test, flagged, zero_division=0))
+    assert metrics['f1'] == pytest.approx(f1_score(y_test, flagged, zero_division=0))